@@ -1,5 +1,4 @@
-import json
-import requests
+from http_client import get_json
 
 import matplotlib.pyplot as plt
 
@@ -13,7 +12,7 @@ search_params = {
     'q': "{:.4f},{:.4f}".format(lat, lon)
 }
 
-location = json.loads(requests.get("http://dataservice.accuweather.com/locations/v1/cities/geoposition/search", params=search_params).content)
+location = get_json("http://dataservice.accuweather.com/locations/v1/cities/geoposition/search", params=search_params)
 location_key = int(location['Key'])
 
 print(location)
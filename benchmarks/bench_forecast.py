@@ -0,0 +1,151 @@
+# Benchmarks every stage of generate_forecast on synthetic inputs (see conftest.py): run detection, GRIB
+# downloads from the stand-in server, building the grid index, nearest grid point search and interpolation
+# weights, decoding, unit conversion, the consensus, window statistics and plotting, and then the whole
+# pipeline end to end from a cold start. Run from the repository root with
+#
+#     python -m pytest benchmarks/bench_forecast.py --benchmark-autosave
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import grid_index
+import models
+from benchmarks.synthetic import seed_nws_points, synthetic_forecast_datasets, SYNTHETIC_GRID
+from consensus import consensus_dataset
+from downloads import iter_herbie_downloads
+from generate_forecast import generate_forecast, generate_forecasts, forecast_time_series, plot_temperature_forecast, plot_wind_speed_forecast, plot_precipitation_forecast
+from grid_index import nearest_grid_points, INTERPOLATION_METHODS
+from points import grib_grid_index, grib_point_values, station_extraction
+from precipitation import deaccumulate_dataset
+from run_availability import latest_complete_run
+from utils import compute_6Z_times
+from window_statistics import window_statistics, datasets_frame, window_rows
+
+FORECAST_MODEL = "hrrr"  # Hourly out to 18 hours with all four fields.
+FORECAST_SOURCES = ["hrrr", "rap", "nam", "gfs", "ecmwf", "nws"]
+FORECAST_STATIONS = 8  # For generate_forecasts, every station costs three plots.
+
+@pytest.fixture
+def forecast_datasets(stations):
+    first_6Z, _ = compute_6Z_times()
+    datasets = synthetic_forecast_datasets(stations, FORECAST_SOURCES, first_6Z - pd.Timedelta(hours=6))
+    datasets["consensus"] = consensus_dataset(datasets)
+    return datasets
+
+@pytest.fixture
+def index(grib_directory):
+    return grib_grid_index(str(grib_directory / "f000.grib2"))
+
+def test_run_detection(measure, synthetic_models, cold_start):
+    config = models.MODELS[FORECAST_MODEL]
+    run = measure(latest_complete_run, config["index_url"], config["cadence_hours"], config["forecast_hours"], n=config["latest_runs"],
+                  setup=cold_start, items=config["latest_runs"], unit="probes")
+    assert synthetic_models.published(run)
+
+def test_run_detection_cached(measure, synthetic_models):
+    config = models.MODELS[FORECAST_MODEL]
+    measure(latest_complete_run, config["index_url"], config["cadence_hours"], config["forecast_hours"], n=config["latest_runs"])
+
+def test_download(measure, synthetic_models, cold_start):
+    forecast_time = models.latest_model_forecast_time(FORECAST_MODEL)
+    products = models.model_products(FORECAST_MODEL, forecast_time)
+    fields = models.MODELS[FORECAST_MODEL]["fields"]
+    mib = sum(last - first + 1 for product in products for field in fields for first, last in product.subset_ranges(field)) / 2**20
+
+    def download():
+        return [failed for _, failed in iter_herbie_downloads(products, fields)]
+
+    failures = measure(download, setup=cold_start, items=mib, unit="MiB")
+    assert not any(failures)
+
+def test_grid_index(measure, grib_directory, cold_start):
+    measure(grib_grid_index, str(grib_directory / "f000.grib2"), setup=cold_start, items=np.prod(SYNTHETIC_GRID), unit="grid_points")
+
+def test_nearest_point_search(measure, index, stations):
+    lats = [lat for _, lat, _ in stations]
+    lons = [lon for _, _, lon in stations]
+    measure(nearest_grid_points, index, lats, lons, items=len(stations), unit="stations")
+
+def forget_weights():
+    grid_index._weights.clear()
+    for filepath in glob.glob(grid_index.weights_filepath("*")):
+        os.remove(filepath)
+
+@pytest.mark.parametrize("method", INTERPOLATION_METHODS)
+def test_station_extraction(measure, index, stations, method):
+    # Without cached weights, like the first run on a new set of stations.
+    measure(station_extraction, index, stations, method=method, verbose=False, setup=forget_weights, items=len(stations), unit="stations")
+
+def test_decode(measure, grib_directory, index, stations):
+    filepaths = sorted(glob.glob(str(grib_directory / "f*.grib2")))
+    points = station_extraction(index, stations, verbose=False)["points"]
+
+    def decode():
+        return [grib_point_values(filepath, points) for filepath in filepaths]
+
+    values = measure(decode, items=sum(len([v for v in hour if not v.endswith("_hours")]) for hour in decode()), unit="messages")
+    assert values[1]["tp_hours"][0] == 1
+
+def test_unit_conversion(measure, stations):
+    # A run's raw station values (GRIB variables and units, precipitation accumulated since the start of
+    # the run) to our variables and units with precipitation since the previous output time.
+    forecast_time = pd.Timestamp("2022-09-10 00:00")
+    hours = models.forecast_hours("ecmwf")
+    rng = np.random.default_rng(0)
+    shape = (len(hours), len(stations))
+    dims = ("time", "station")
+
+    point = xr.Dataset({
+        "t2m": (dims, rng.normal(290, 5, shape)),
+        "u10": (dims, rng.normal(3, 4, shape)),
+        "v10": (dims, rng.normal(0, 4, shape)),
+        "tp": (dims, np.cumsum(rng.exponential(0.5, shape), axis=0)),
+        "tp_hours": (dims, np.broadcast_to(np.array(hours, dtype=np.float64)[:, None], shape))
+    }, coords={"time": forecast_time + pd.to_timedelta(hours, unit="h"), "station": [station for station, _, _ in stations]})
+
+    def convert():
+        return deaccumulate_dataset(models.model_variables("ecmwf", point), forecast_time)
+
+    ds = measure(convert, items=point["t2m"].size, unit="station_hours")
+    assert "precipitation_hours" not in ds
+
+def test_consensus(measure, stations):
+    first_6Z, _ = compute_6Z_times()
+    datasets = synthetic_forecast_datasets(stations, FORECAST_SOURCES, first_6Z - pd.Timedelta(hours=6))
+    measure(consensus_dataset, datasets, items=len(stations), unit="stations")
+
+def test_window_statistics(measure, forecast_datasets, stations):
+    stats = measure(lambda: window_statistics(datasets_frame(forecast_datasets)), items=len(stations), unit="stations")
+    assert not stats.empty
+
+@pytest.mark.parametrize("plot", [plot_temperature_forecast, plot_wind_speed_forecast, plot_precipitation_forecast], ids=lambda plot: plot.__name__)
+def test_plotting(measure, forecast_datasets, stations, plot):
+    station = stations[0][0]
+    first_6Z, second_6Z = compute_6Z_times()
+    stats = window_rows(window_statistics(datasets_frame(forecast_datasets)), station, first_6Z)
+    timeseries = forecast_time_series(forecast_datasets, station)
+    measure(plot, timeseries, stats, station, first_6Z, second_6Z, f"{plot.__name__}.png", items=1, unit="plots")
+
+def test_generate_forecast(measure, synthetic_models, cold_start, stations):
+    station, lat, lon = stations[0]
+
+    def setup():
+        cold_start()
+        seed_nws_points(stations[:1], synthetic_models)
+
+    failures = measure(generate_forecast, station, lat, lon, setup=setup, rounds=3, items=1, unit="stations")
+    assert not failures
+
+def test_generate_forecasts(measure, synthetic_models, cold_start, stations):
+    stations = stations[:FORECAST_STATIONS]
+
+    def setup():
+        cold_start()
+        seed_nws_points(stations, synthetic_models)
+
+    failures = measure(generate_forecasts, stations, setup=setup, rounds=3, items=len(stations), unit="stations")
+    assert not failures
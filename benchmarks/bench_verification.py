@@ -0,0 +1,98 @@
+# Benchmarks every stage of compute_model_biases on synthetic inputs (see conftest.py): METAR ingestion and
+# window queries, hourly METAR precipitation, window statistics, biases and plotting, and then the whole
+# verification end to end from a cold start, with the model runs downloaded from the stand-in server.
+# Run from the repository root with
+#
+#     python -m pytest benchmarks/bench_verification.py --benchmark-autosave
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import synthetic_forecast_datasets
+from metar import metar_timeseries
+from metar_store import ingest_metar_csv
+from model_biases import (compute_model_biases, compute_stations_model_biases, compute_biases, biases_dataframe, metar_window,
+                          plot_temperature_verification, plot_wind_speed_verification, plot_biases, VERIFICATION_MODEL_RUNS)
+from precipitation import window_precipitation_frame
+from utils import compute_6Z_times
+from window_statistics import window_statistics, time_series_frame, datasets_frame, window_rows
+
+# Inside the year of synthetic METARs (see benchmarks.metar_parsing.synthetic_metar_csv).
+VERIFICATION_DATES = pd.date_range("2018-06-10", periods=3)
+VERIFICATION_STATIONS = 4  # For compute_stations_model_biases, every station and date costs two plots.
+
+@pytest.fixture
+def verification(stations, metar_csv):
+    # What verify_date works with for the first verification date: every station's METAR window and the
+    # models' datasets, in our units.
+    verification_date = VERIFICATION_DATES[0]
+    observations = metar_timeseries(metar_csv[0])
+    start, end = verification_date - pd.Timedelta(hours=6), verification_date + pd.Timedelta(days=1, hours=18)
+    metar = {station: observations[start:end] for station, _, _ in stations}
+    datasets = synthetic_forecast_datasets(stations, VERIFICATION_MODEL_RUNS, verification_date - pd.Timedelta(days=1))
+    return verification_date, metar, datasets
+
+def verification_statistics(stations, metar, datasets):
+    # Like verify_date: METAR windows with hourly precipitation next to the models, all in one frame.
+    frame = pd.concat([
+        time_series_frame({("metar", station): window_precipitation_frame(metar[station]) for station, _, _ in stations}),
+        datasets_frame(datasets)
+    ], ignore_index=True)
+    return window_statistics(frame)
+
+def test_metar_ingest(measure, metar_csv, cold_start):
+    filepath, n = metar_csv
+    measure(ingest_metar_csv, filepath, station="KFMY", setup=cold_start, items=n, unit="observations")
+
+def test_metar_query(measure, metar_csv):
+    ingest_metar_csv(metar_csv[0], station="KFMY")
+    metar = measure(metar_window, "KFMY", VERIFICATION_DATES[0])
+    assert not metar.empty
+
+def test_metar_hourly_precipitation(measure, verification, stations):
+    _, metar, _ = verification
+    measure(lambda: [window_precipitation_frame(metar[station]) for station, _, _ in stations], items=len(stations), unit="stations")
+
+def test_window_statistics(measure, verification, stations):
+    _, metar, datasets = verification
+    stats = measure(verification_statistics, stations, metar, datasets, items=len(stations), unit="stations")
+    assert not stats.empty
+
+def test_compute_biases(measure, verification, stations):
+    verification_date, metar, datasets = verification
+    stats = verification_statistics(stations, metar, datasets)
+    first_6Z, _ = compute_6Z_times(verification_date - pd.Timedelta(days=1))
+
+    biases = measure(lambda: [compute_biases(window_rows(stats, station, first_6Z), verification_date) for station, _, _ in stations],
+                     items=len(stations), unit="stations")
+    assert np.isfinite(biases[0]["nam"]["T_max"])
+
+@pytest.mark.parametrize("plot", [plot_temperature_verification, plot_wind_speed_verification], ids=lambda plot: plot.__name__)
+def test_plotting(measure, verification, stations, plot):
+    verification_date, metar, datasets = verification
+    station = stations[0][0]
+    timeseries = {"metar": metar[station]}
+    timeseries.update({model: ds.sel(station=station).to_pandas() for model, ds in datasets.items()})
+    measure(plot, timeseries, verification_date, station, f"{plot.__name__}.png", items=1, unit="plots")
+
+def test_plot_biases(measure, stations):
+    # A month of stored biases.
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2018-06-01", periods=30)
+    variables = ("T_min", "T_max", "wind_speed", "precipitation")
+    biases = {date: {model: {var: rng.normal() for var in variables} for model in ("nam", "gfs", "ecmwf")} for date in dates}
+    measure(plot_biases, biases_dataframe(biases), stations[0][0], "bias_verification.png", items=1, unit="plots")
+
+def test_compute_model_biases(measure, synthetic_models, cold_start, metar_csv, stations):
+    station, lat, lon = stations[0]
+    failures = measure(compute_model_biases, lat, lon, station, str(metar_csv[0]), VERIFICATION_DATES, incremental=False,
+                       setup=cold_start, rounds=3, items=len(VERIFICATION_DATES), unit="dates")
+    assert not failures
+
+def test_compute_stations_model_biases(measure, synthetic_models, cold_start, metar_csv, stations):
+    stations = stations[:VERIFICATION_STATIONS]
+    metar_filepaths = {station: str(metar_csv[0]) for station, _, _ in stations}
+    failures = measure(compute_stations_model_biases, stations, metar_filepaths, VERIFICATION_DATES, incremental=False,
+                       setup=cold_start, rounds=3, items=len(VERIFICATION_DATES) * len(stations), unit="station_dates")
+    assert not failures
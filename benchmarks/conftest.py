@@ -0,0 +1,123 @@
+# Fixtures for the pytest-benchmark suite of the forecast (generate_forecast) and verification
+# (model_biases) pipelines. Everything runs against synthetic inputs and nothing touches the network:
+# GRIB files on a small regular lat-lon grid and NWS hourly forecasts are served by a local stand-in
+# server (byte ranges, HEAD requests for GRIB indices and JSON) and METAR archives are synthetic IEM CSVs.
+# Run from the repository root with
+#
+#     python -m pytest benchmarks/bench_forecast.py benchmarks/bench_verification.py --benchmark-autosave
+#
+# Every run is saved under .benchmarks/ and later commits can be compared against it with
+# --benchmark-compare (the last saved run, or e.g. --benchmark-compare=0001) and fail on regressions with
+# e.g. --benchmark-compare-fail=mean:10%. Peak memory (MiB) and throughput are saved with every benchmark
+# in its extra_info, e.g. `pytest-benchmark compare --group-by=name` lists the runs side by side.
+
+import os
+import shutil
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import grid_index
+import models
+from benchmarks.metar_parsing import synthetic_metar_csv
+from benchmarks.nws_parsing import synthetic_nws_periods
+from benchmarks.synthetic import SyntheticServer, SyntheticProduct, synthetic_grib_hour, synthetic_stations, SYNTHETIC_HOURS
+
+@pytest.fixture(scope="session")
+def synthetic_hours():
+    return [synthetic_grib_hour(fxx) for fxx in range(SYNTHETIC_HOURS)]
+
+@pytest.fixture(scope="session")
+def stations():
+    return synthetic_stations()
+
+@pytest.fixture(scope="session")
+def synthetic_server(synthetic_hours):
+    start = pd.Timestamp.now(tz="America/New_York").floor("h").tz_localize(None)
+    server = SyntheticServer(synthetic_hours, {"properties": {"periods": synthetic_nws_periods(start=str(start))}})
+    yield server
+    server.shutdown()
+
+@pytest.fixture(scope="session")
+def grib_directory(tmp_path_factory, synthetic_hours):
+    # The synthetic forecast hours as local files, for the stages after the download.
+    directory = tmp_path_factory.mktemp("grib")
+    for fxx, (grib, _) in enumerate(synthetic_hours):
+        (directory / f"f{fxx:03d}.grib2").write_bytes(grib)
+    return directory
+
+@pytest.fixture(scope="session")
+def metar_csv(tmp_path_factory):
+    # A year of hourly observations, the same archive for every station.
+    filepath = tmp_path_factory.mktemp("metar") / "synthetic_metar.csv"
+    n = synthetic_metar_csv(filepath, years=1)
+    return filepath, n
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Point caches, grid indices, the METAR store, downloads and plots all live in the working directory.
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def cold_start(workdir):
+    # Returns a function that starts over in an empty working directory with no grid index or weights in memory,
+    # i.e. what a cron run sees the first time. Use it as the setup of benchmark.pedantic rounds.
+    def cold_start():
+        os.chdir(workdir)
+        shutil.rmtree(workdir / "run", ignore_errors=True)
+        os.mkdir(workdir / "run")
+        os.chdir(workdir / "run")
+        grid_index._grid_indices.clear()
+        grid_index._weights.clear()
+    return cold_start
+
+@pytest.fixture
+def synthetic_models(monkeypatch, synthetic_server):
+    # Every model in models.MODELS fetches its products from the stand-in server and detects its latest
+    # complete run against it, so the whole pipeline runs as is.
+    def model_products(model, forecast_time, hours=None, member=None):
+        config = models.MODELS[model]
+        return [SyntheticProduct(synthetic_server, config["model"], config["product"], forecast_time, h, member=member)
+                for h in models.forecast_hours(model, hours)]
+
+    monkeypatch.setattr(models, "model_products", model_products)
+    for model in models.MODELS:
+        monkeypatch.setitem(models.MODELS[model], "index_url", synthetic_server.index_url(model))
+
+    return synthetic_server
+
+@pytest.fixture
+def measure(benchmark):
+    # measure(function, *args, items=..., unit=..., setup=..., rounds=..., **kwargs) benchmarks function and
+    # records its peak memory and throughput (items per second) in the benchmark's extra_info. Peak
+    # memory is from one extra untimed call under tracemalloc, which sees numpy's allocations and every
+    # thread's but not those of worker processes or C libraries (e.g. ecCodes) that bypass Python's allocator.
+    def measure(function, *args, items=None, unit="items", setup=None, rounds=5, **kwargs):
+        if setup is not None:
+            setup()
+
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        benchmark.extra_info["peak_memory_mib"] = round(peak / 2**20, 3)
+
+        if setup is None:
+            result = benchmark(function, *args, **kwargs)
+        else:
+            result = benchmark.pedantic(function, args=args, kwargs=kwargs, setup=setup, rounds=rounds)
+
+        if items is not None:
+            benchmark.extra_info["items"] = items
+            benchmark.extra_info["unit"] = unit
+            if benchmark.stats is not None:
+                benchmark.extra_info[f"{unit}_per_second"] = round(items / benchmark.stats.stats.mean, 3)
+
+        return result
+
+    return measure
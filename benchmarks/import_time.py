@@ -0,0 +1,36 @@
+# Measures how long it takes just to import the entry point modules, i.e. the fixed cost of every
+# cron run before any work is done. Run from the repository root with
+#
+#     python -m benchmarks.import_time [module ...]
+
+import sys
+import subprocess
+
+ENTRY_POINTS = ["generate_forecast", "model_biases", "nws", "metar_store", "plotting"]
+
+def import_times(module):
+    # `python -X importtime` writes "import time: self [us] | cumulative | imported package" lines to stderr.
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    return times
+
+if __name__ == "__main__":
+    modules = sys.argv[1:] or ENTRY_POINTS
+
+    for module in modules:
+        times = import_times(module)
+        total = next(cumulative for name, _, cumulative in reversed(times) if name == module)
+
+        print(f"{module}: {total / 1e3:.0f} ms ({len(times)} modules imported)")
+        for name, _, cumulative in sorted(times, key=lambda t: -t[2])[1:6]:
+            print(f"    {name:<40s} {cumulative / 1e3:8.1f} ms")
@@ -0,0 +1,75 @@
+# Compares the vectorized METAR loader against the original row-by-row one (kept in metar.py as the
+# reference) on a synthetic multi-year IEM archive. Run from the repository root with
+#
+#     python -m benchmarks.metar_parsing [years]
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from metar import metar_timeseries, metar_timeseries_rowwise
+
+def synthetic_metar_csv(filepath, years=5, seed=0):
+    # Routine hourly observations at :53 like a real ASOS station, with missing ("M") and trace ("T") values sprinkled in.
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2018-01-01 00:53", periods=years * 365 * 24, freq="h")
+    n = times.size
+
+    def with_sentinels(values, sentinels):
+        values = values.astype(object)
+        for sentinel, fraction in sentinels.items():
+            values[rng.random(n) < fraction] = sentinel
+        return values
+
+    df = pd.DataFrame({
+        "station": "KFMY",
+        "valid": times.strftime("%Y-%m-%d %H:%M"),
+        "lon": -81.8633,
+        "lat": 26.5866,
+        "tmpf": with_sentinels(np.round(rng.normal(75, 8, n), 1), {"M": 0.01}),
+        "dwpf": with_sentinels(np.round(rng.normal(65, 8, n), 1), {"M": 0.01}),
+        "sknt": with_sentinels(rng.integers(0, 25, n).astype(float), {"M": 0.02}),
+        "p01i": with_sentinels(np.round(rng.exponential(0.02, n), 2), {"M": 0.05, "T": 0.05}),
+        "alti": np.round(rng.normal(30, 0.1, n), 2),
+        "skyc1": rng.choice(["CLR", "FEW", "SCT", "BKN", "OVC"], n),
+        "metar": "KFMY 010053Z AUTO 00000KT 10SM CLR 24/21 A3001 RMK AO2"
+    })
+
+    df.to_csv(filepath, index=False)
+    return n
+
+def benchmark(function, *args, repeats=3, **kwargs):
+    tracemalloc.start()
+    result = function(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    return result, min(timings), peak
+
+if __name__ == "__main__":
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    filepath = f"synthetic_metar_{years}yr.csv"
+    n = synthetic_metar_csv(filepath, years=years)
+    print(f"{filepath}: {n} observations")
+
+    rowwise, t_rowwise, m_rowwise = benchmark(metar_timeseries_rowwise, filepath)
+    vectorized, t_vectorized, m_vectorized = benchmark(metar_timeseries, filepath)
+    chunked, t_chunked, m_chunked = benchmark(metar_timeseries, filepath, chunksize=50_000)
+
+    os.remove(filepath)
+
+    pd.testing.assert_frame_equal(vectorized, rowwise, check_freq=False, check_index_type=False)
+    pd.testing.assert_frame_equal(chunked, vectorized)
+
+    print(f"row-by-row: {t_rowwise:.3f} s, peak {m_rowwise / 2**20:.1f} MiB")
+    print(f"vectorized: {t_vectorized:.3f} s, peak {m_vectorized / 2**20:.1f} MiB ({t_rowwise / t_vectorized:.1f}x faster)")
+    print(f"chunked:    {t_chunked:.3f} s, peak {m_chunked / 2**20:.1f} MiB ({t_rowwise / t_chunked:.1f}x faster)")
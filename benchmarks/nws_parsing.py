@@ -0,0 +1,80 @@
+# Compares the vectorized NWS hourly forecast parser against the original per-period implementation on a
+# response shaped like api.weather.gov/gridpoints/{wfo}/{x},{y}/forecast/hourly (156 hourly periods,
+# spanning a DST change). Run from the repository root with
+#
+#     python -m benchmarks.nws_parsing [repeats]
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from nws import parse_nws_periods, MILES_PER_HOUR_TO_KNOTS
+
+def parse_nws_periods_loop(periods):
+    # The original implementation, kept here as the baseline.
+    n_periods = len(periods)
+
+    times = [pd.Timestamp(periods[p]["startTime"]).tz_convert("UTC").tz_localize(None) for p in range(n_periods)]
+    temperature = [periods[p]["temperature"] for p in range(n_periods)]
+    wind_speed = [MILES_PER_HOUR_TO_KNOTS * float(periods[p]["windSpeed"].split()[0]) for p in range(n_periods)]
+
+    timeseries = pd.DataFrame({
+        "temperature": temperature,
+        "wind_speed": wind_speed,
+    }, index=times)
+
+    return timeseries
+
+def synthetic_nws_periods(n=156, start="2022-11-05 18:00", seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=n, freq="h", tz="America/New_York")
+    periods = []
+
+    for k, t in enumerate(times):
+        low = int(rng.integers(0, 25))
+        wind_speed = f"{low} mph" if rng.random() < 0.8 else f"{low} to {low + int(rng.integers(5, 15))} mph"
+        periods.append({
+            "number": k + 1,
+            "name": "",
+            "startTime": t.isoformat(),
+            "endTime": (t + pd.Timedelta(hours=1)).isoformat(),
+            "isDaytime": 6 <= t.hour < 18,
+            "temperature": int(rng.integers(20, 90)),
+            "temperatureUnit": "F",
+            "temperatureTrend": None,
+            "probabilityOfPrecipitation": {"unitCode": "wmoUnit:percent", "value": int(rng.integers(0, 100))},
+            "dewpoint": {"unitCode": "wmoUnit:degC", "value": float(rng.normal(5, 5))},
+            "relativeHumidity": {"unitCode": "wmoUnit:percent", "value": int(rng.integers(20, 100))},
+            "windSpeed": wind_speed,
+            "windGust": f"{low + 10} mph" if rng.random() < 0.2 else None,
+            "windDirection": "NW",
+            "icon": "https://api.weather.gov/icons/land/night/few?size=small",
+            "shortForecast": "Mostly Clear",
+            "detailedForecast": ""
+        })
+
+    return periods
+
+def benchmark(function, *args, repeats=100):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    periods = synthetic_nws_periods()
+
+    loop, t_loop = benchmark(parse_nws_periods_loop, periods, repeats=repeats)
+    vectorized, t_vectorized = benchmark(parse_nws_periods, periods, repeats=repeats)
+
+    pd.testing.assert_frame_equal(vectorized[["temperature", "wind_speed"]], loop, check_dtype=False, check_freq=False, check_index_type=False)
+    assert (vectorized["wind_speed_max"] >= vectorized["wind_speed"]).all()
+
+    print(f"{len(periods)} periods, best of {repeats}")
+    print(f"per-period: {1e3 * t_loop:.2f} ms")
+    print(f"vectorized: {1e3 * t_vectorized:.2f} ms ({t_loop / t_vectorized:.1f}x faster)")
+    print(vectorized.describe().loc[["count", "mean", "max"]].round(1).T)
@@ -0,0 +1,77 @@
+# Compares extracting station values for every forecast hour with one product by the precomputed sparse
+# interpolation weights against selecting grid points station by station, hour by hour, on a synthetic
+# HRRR-sized curvilinear grid. Run from the repository root with
+#
+#     python -m benchmarks.point_extraction [stations] [hours]
+
+import sys
+import time
+import tempfile
+import numpy as np
+
+import grid_index
+from grid_index import build_grid_index, nearest_grid_points, interpolation_weights, neighbourhood_grid_points, INTERPOLATION_METHODS
+
+def synthetic_grid(ny=1059, nx=1799, seed=0):
+    # Roughly the HRRR CONUS grid: 3 km, slightly rotated and sheared like a Lambert conformal projection.
+    I, J = np.meshgrid(np.arange(ny), np.arange(nx), indexing="ij")
+    lats = 21.1 + 0.027 * I + 0.002 * J
+    lons = 237.3 + 0.032 * J - 0.003 * I
+    rng = np.random.default_rng(seed)
+    return lats, lons, rng
+
+def closest_xy(index, target_lats, target_lons):
+    # One lookup per station, like utils.closest_xy_coordinates.
+    return [np.unravel_index(nearest_grid_points(index, lat, lon)[0][0], index["shape"]) for lat, lon in zip(target_lats, target_lons)]
+
+def select_station_by_station(fields, xy):
+    # The original approach: index every station's nearest grid point in every hour separately.
+    values = np.empty((fields.shape[0], len(xy)))
+    for s, (x, y) in enumerate(xy):
+        for h in range(fields.shape[0]):
+            values[h, s] = fields[h, x, y]
+    return values
+
+def benchmark(function, *args, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+if __name__ == "__main__":
+    n_stations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_hours = int(sys.argv[2]) if len(sys.argv) > 2 else 48
+
+    lats, lons, rng = synthetic_grid()
+    fields = rng.normal(280, 5, (n_hours, *lats.shape)).astype(np.float32)
+    target_lats = rng.uniform(25, 45, n_stations)
+    target_lons = rng.uniform(245, 285, n_stations)
+
+    grid_index.GRID_INDEX_DIRECTORY = tempfile.mkdtemp()
+    index, t_index = benchmark(build_grid_index, lats, lons, repeats=1)
+    print(f"{lats.size} grid points, {n_stations} stations, {n_hours} hours")
+    print(f"grid index: {t_index:.2f} s (once per grid)")
+
+    xy, t_closest = benchmark(closest_xy, index, target_lats, target_lons, repeats=1)
+    selected, t_select = benchmark(select_station_by_station, fields, xy, repeats=10)
+    print(f"station by station:   {1e3 * t_select:9.3f} ms (closest grid points {1e3 * t_closest:.1f} ms once)")
+
+    flat = fields.reshape(n_hours, -1)
+    for method in INTERPOLATION_METHODS:
+        start = time.perf_counter()
+        W = interpolation_weights(index, target_lats, target_lons, method=method)
+        t_weights = time.perf_counter() - start
+
+        # Like points.station_extraction: only the grid points with weights are ever decoded.
+        points = np.unique(W.indices)
+        W_points = W[:, points]
+        extracted, t_extract = benchmark(lambda: (W_points @ flat[:, points].T).T, repeats=10)
+        print(f"{method + ':':21s} {1e3 * t_extract:9.3f} ms ({t_select / t_extract:.1f}x faster, weights {1e3 * t_weights:.1f} ms once)")
+
+        if method == "nearest":
+            np.testing.assert_allclose(extracted, selected, rtol=1e-6)
+
+    neighbours = neighbourhood_grid_points(index, target_lats, target_lons)
+    assert (neighbours >= 0).all()
@@ -0,0 +1,222 @@
+# Synthetic inputs for the benchmark suite (see conftest.py): GRIB forecast hours, a local stand-in for
+# the GRIB/NWS servers, Herbie-like products that download from it, stations and forecast datasets.
+
+import os
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+import requests
+import xarray as xr
+
+from nws import NWS_POINTS_FILEPATH
+from utils import longitude_east_to_west
+
+# (Nj, Ni) at 0.2° x 0.25° over CONUS, ~37,500 grid points per message.
+SYNTHETIC_GRID = (150, 250)
+SYNTHETIC_GRID_ORIGIN = (50.0, 230.0)
+SYNTHETIC_GRID_SPACING = (0.2, 0.25)
+
+SYNTHETIC_HOURS = 61  # Forecast hours 0-60, the longest default horizon in models.MODELS (ECMWF).
+SYNTHETIC_STATIONS = 40
+SYNTHETIC_MESSAGES = ["2t", "10u", "10v", "tp"]
+
+# GRIB search strings (see models.MODELS) -> the messages they match. NAM packs u and v into one message.
+SYNTHETIC_FIELDS = {
+    ":TMP:2 m": ["2t"],
+    ":UGRD:10 m": ["10u"],
+    ":VGRD:10 m": ["10v"],
+    ":APCP:": ["tp"],
+    ":2t:": ["2t"],
+    ":10u:": ["10u"],
+    ":10v:": ["10v"],
+    ":tp:": ["tp"]
+}
+PACKED_WINDS = {"nam": ["10u", "10v"]}
+
+PUBLICATION_DELAY = pd.Timedelta(hours=3)  # Runs younger than this aren't published by the stand-in server.
+
+def synthetic_grib_hour(fxx, seed=0):
+    # One forecast hour as a GRIB2 file with 2 m temperature, 10 m winds and the precipitation since the
+    # start of the run (in meters, like ECMWF), plus the byte range of every message in it like a GRIB index.
+    from eccodes import codes_grib_new_from_samples, codes_clone, codes_set, codes_set_values, codes_get_message, codes_release
+
+    ny, nx = SYNTHETIC_GRID
+    lat0, lon0 = SYNTHETIC_GRID_ORIGIN
+    dlat, dlon = SYNTHETIC_GRID_SPACING
+    rng = np.random.default_rng(seed + fxx)
+
+    sample = codes_grib_new_from_samples("regular_ll_sfc_grib2")
+    codes_set(sample, "Ni", nx)
+    codes_set(sample, "Nj", ny)
+    codes_set(sample, "latitudeOfFirstGridPointInDegrees", lat0)
+    codes_set(sample, "longitudeOfFirstGridPointInDegrees", lon0)
+    codes_set(sample, "latitudeOfLastGridPointInDegrees", lat0 - dlat * (ny - 1))
+    codes_set(sample, "longitudeOfLastGridPointInDegrees", lon0 + dlon * (nx - 1))
+    codes_set(sample, "jDirectionIncrementInDegrees", dlat)
+    codes_set(sample, "iDirectionIncrementInDegrees", dlon)
+
+    lats = np.linspace(lat0, lat0 - dlat * (ny - 1), ny)[:, None]
+    diurnal = 5 * np.sin(2 * np.pi * fxx / 24)
+    fields = {
+        "2t": 310 - 0.8 * (lats - 20) + diurnal + rng.normal(0, 1, (ny, nx)),
+        "10u": rng.normal(3, 4, (ny, nx)),
+        "10v": rng.normal(0, 4, (ny, nx)),
+        "tp": 1e-4 * fxx * rng.gamma(0.5, 2, (ny, nx))
+    }
+
+    messages = []
+    ranges = {}
+    for name in SYNTHETIC_MESSAGES:
+        if name == "tp" and fxx == 0:
+            continue  # Nothing is accumulated at the analysis.
+
+        gid = codes_clone(sample)
+        codes_set(gid, "shortName", name)
+        if name == "tp":
+            codes_set(gid, "stepType", "accum")
+            codes_set(gid, "startStep", 0)
+            codes_set(gid, "endStep", fxx)
+        else:
+            codes_set(gid, "step", fxx)
+        codes_set_values(gid, np.broadcast_to(fields[name], (ny, nx)).ravel())
+
+        message = codes_get_message(gid)
+        codes_release(gid)
+
+        first = sum(map(len, messages))
+        ranges[name] = (first, first + len(message) - 1)
+        messages.append(message)
+
+    codes_release(sample)
+    return b"".join(messages), ranges
+
+def synthetic_stations(n=SYNTHETIC_STATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(f"S{k:03d}", float(lat), float(lon)) for k, (lat, lon) in enumerate(zip(rng.uniform(25, 48, n), rng.uniform(235, 290, n)))]
+
+class SyntheticServer:
+    # Serves every model and run the same synthetic forecast hours, GRIB indices for runs older than
+    # PUBLICATION_DELAY (so run detection has unpublished cycles to skip) and NWS hourly forecasts.
+    def __init__(self, hours, nws_forecast):
+        self.hours = hours
+        self.nws_forecast = json.dumps(nws_forecast).encode()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def published(self, run):
+        return pd.Timestamp(run) <= pd.Timestamp.now("UTC").tz_localize(None) - PUBLICATION_DELAY
+
+    def handler(self):
+        synthetic = self
+
+        class SyntheticHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real servers.
+
+            def respond(self, status, body=b"", content_type="application/octet-stream"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                # /{model}/{YYYYmmddHH}/f{fxx}.idx
+                _, model, run, _ = self.path.split("/")
+                self.respond(200 if synthetic.published(pd.to_datetime(run, format="%Y%m%d%H")) else 404)
+
+            def do_GET(self):
+                if self.path.startswith("/nws/"):
+                    return self.respond(200, synthetic.nws_forecast, content_type="application/geo+json")
+
+                # /{model}/{YYYYmmddHH}/f{fxx:03d}.grib2 with a byte range.
+                fxx = int(self.path.rsplit("/f", 1)[1].removesuffix(".grib2"))
+                grib, _ = synthetic.hours[fxx]
+                first, last = self.headers["Range"].removeprefix("bytes=").split("-")
+                self.respond(206, grib[int(first):int(last)+1])
+
+            def log_message(self, *args):
+                pass
+
+        return SyntheticHandler
+
+    def index_url(self, model):
+        return f"{self.url}/{model}/{{date:%Y%m%d%H}}/f{{fxx:03d}}.idx"
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SyntheticProduct:
+    # Stands in for a Herbie object: each field's GRIB subset is fetched from the stand-in server by byte
+    # range into a local file, just like Herbie fetches them from NOMADS/AWS with the GRIB index.
+    def __init__(self, server, model, product, date, fxx, member=None):
+        self.server = server
+        self.model = model
+        self.product = product
+        self.date = pd.Timestamp(date)
+        self.fxx = fxx
+        self.member = member
+        self.grib = f"{server.url}/{model}/{self.date:%Y%m%d%H}/f{fxx:03d}.grib2"
+
+    def get_localFilePath(self, field):
+        subset = "".join(c for c in field if c.isalnum())
+        return os.path.join("grib", self.model, f"{self.date:%Y%m%d%H}", f"f{self.fxx:03d}_{subset}.grib2")
+
+    def subset_ranges(self, field):
+        # The byte ranges of the messages matching field, what Herbie reads off the GRIB index.
+        _, ranges = self.server.hours[self.fxx]
+        names = PACKED_WINDS.get(self.model, SYNTHETIC_FIELDS[field]) if field == ":VGRD:10 m" else SYNTHETIC_FIELDS[field]
+        return [ranges[name] for name in names if name in ranges]
+
+    def download(self, field, verbose=False):
+        chunks = []
+        for first, last in self.subset_ranges(field):
+            response = requests.get(self.grib, headers={"Range": f"bytes={first}-{last}"})
+            response.raise_for_status()
+            chunks.append(response.content)
+
+        filepath = self.get_localFilePath(field)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as f:
+            f.write(b"".join(chunks))
+        return filepath
+
+def synthetic_forecast_datasets(stations, sources, start, hours=SYNTHETIC_HOURS, seed=0):
+    # (time, station) datasets in our units for every source, like fetch_forecast_datasets returns them.
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=hours, freq="h")
+    diurnal = 10 * np.sin(2 * np.pi * np.arange(hours) / 24)[:, None]
+    names = [station for station, _, _ in stations]
+    shape = (hours, len(stations))
+
+    return {
+        source: xr.Dataset({
+            "temperature": (("time", "station"), 60 + diurnal + rng.normal(0, 2, shape)),
+            "wind_speed": (("time", "station"), rng.gamma(2, 4, shape)),
+            "precipitation": (("time", "station"), rng.exponential(0.01, shape) * (rng.random(shape) < 0.3))
+        }, coords={"time": times, "station": names})
+        for source in sources
+    }
+
+def seed_nws_points(stations, server):
+    # Resolved api.weather.gov points pointing at the stand-in server, as nws.nws_point caches them.
+    points = {}
+    for k, (_, lat, lon) in enumerate(stations):
+        key = f"{lat:.4f},{longitude_east_to_west(lon):.4f}"
+        points[key] = {
+            "cwa": "BOX",
+            "gridX": k,
+            "gridY": k,
+            "forecast": f"{server.url}/nws/{key}/forecast",
+            "forecastHourly": f"{server.url}/nws/{key}/forecast/hourly",
+            "resolved": time.time()
+        }
+
+    with open(NWS_POINTS_FILEPATH, "w") as f:
+        json.dump(points, f)
@@ -0,0 +1,82 @@
+import logging
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from precipitation import reaccumulate, metar_hourly_precipitation_dataarray
+
+logger = logging.getLogger(__name__)
+
+CONSENSUS_FREQ = "1h"
+
+# Sources that are observations rather than forecasts never take part in the consensus.
+OBSERVATION_SOURCES = ("metar",)
+
+# Amounts since the previous time rather than values at a time.
+ACCUMULATED_VARIABLES = ("precipitation",)
+
+def observations_dataset(timeseries):
+    # timeseries maps station to a DataFrame of observations (e.g. METAR) indexed by time.
+    frames = {station: ts.rename_axis("time") for station, ts in timeseries.items()}
+    ds = pd.concat(frames, names=["station"]).to_xarray()
+    return ds.transpose("time", "station")
+
+def common_time_axis(datasets, freq=CONSENSUS_FREQ):
+    start = min(ds.time.values.min() for ds in datasets.values())
+    end = max(ds.time.values.max() for ds in datasets.values())
+    return pd.date_range(pd.Timestamp(start).ceil(freq), pd.Timestamp(end).floor(freq), freq=freq, name="time")
+
+def align_to_time_axis(ds, times, observations=False):
+    # Forecasts are interpolated in time so e.g. 3-hourly ECMWF fills in between its outputs. Forecasts never
+    # extrapolate past their own first and last times. Observations come at irregular times (e.g. METAR at :53
+    # plus specials) so they're averaged over the hour centred on each time instead. Accumulations are
+    # spread over the hours they fell in.
+    freq = pd.Timedelta(times.freq)
+    accumulated = [variable for variable in ACCUMULATED_VARIABLES if variable in ds]
+    instantaneous = ds.drop_vars(accumulated)
+
+    if observations:
+        centred = instantaneous.assign_coords(time=ds.time.values + freq / 2)
+        aligned = centred.resample(time=freq).mean().reindex(time=times)
+        return aligned.assign({variable: metar_hourly_precipitation_dataarray(ds[variable]).reindex(time=times) for variable in accumulated})
+
+    aligned = instantaneous.sortby("time").interp(time=times)
+    return aligned.assign({variable: reaccumulate(ds[variable], times) for variable in accumulated})
+
+def consensus_array(datasets, freq=CONSENSUS_FREQ, observation_sources=OBSERVATION_SOURCES):
+    # datasets maps source to a (time, station) dataset. Returns one (source, time, station, variable) array on
+    # a common time axis, with NaN wherever a source doesn't cover a time or doesn't provide a variable.
+    times = common_time_axis(datasets, freq=freq)
+
+    aligned = [
+        align_to_time_axis(ds, times, observations=(source in observation_sources)).to_array("variable")
+        for source, ds in datasets.items()
+    ]
+
+    array = xr.concat(aligned, dim=pd.Index(list(datasets), name="source"), join="outer")
+    return array.transpose("source", "time", "station", "variable")
+
+def consensus(array, weights=None, observation_sources=OBSERVATION_SOURCES):
+    # Weighted mean and spread (weighted standard deviation) across forecast sources for every time, station
+    # and variable at once. weights maps source to weight, 1 for sources that aren't given. Sources missing at
+    # a point don't count towards it.
+    forecasts = array.sel(source=[source for source in array.source.values if source not in observation_sources])
+
+    weights = weights or {}
+    w = xr.DataArray([weights.get(source, 1.0) for source in forecasts.source.values], dims="source")
+
+    valid = forecasts.notnull()
+    total = (w * valid).sum("source")
+    mean = (forecasts.fillna(0) * w).sum("source") / total
+    spread = np.sqrt(((forecasts - mean).fillna(0)**2 * w).sum("source") / total)
+
+    return xr.Dataset({
+        "mean": mean.where(total > 0),
+        "spread": spread.where(total > 0),
+        "count": valid.sum("source")
+    })
+
+def consensus_dataset(datasets, weights=None, freq=CONSENSUS_FREQ):
+    # The consensus mean as another (time, station) source dataset, e.g. for plotting next to the models.
+    mean = consensus(consensus_array(datasets, freq=freq), weights=weights)["mean"]
+    return mean.to_dataset("variable").dropna("time", how="all")
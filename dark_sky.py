@@ -1,9 +1,7 @@
-import json
-import requests
-import logging.config
+import logging
 from datetime import datetime
+from http_client import get_json, gather, HTTP_CONCURRENCY
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 # Dark Sky API
@@ -12,12 +10,7 @@ DARK_SKY_KEY = "81c07948c439765d630c4c60fc56634e"
 
 def dark_sky_temp_time_series(lat, lon):
     forecast_url = "https://api.darksky.net/forecast/" + DARK_SKY_KEY + "/" + str(lat) + "," + str(lon)
-    response = requests.get(forecast_url)
-    
-    if response.status_code != 200:
-        response.raise_for_status()
-    
-    forecast = json.loads(response.content)
+    forecast = get_json(forecast_url)
 
     city_lat = forecast['latitude']
     city_lon = forecast['longitude']
@@ -68,3 +61,7 @@ def dark_sky_temp_time_series(lat, lon):
         temps.append(T)
 
     return times, temps
+
+def dark_sky_temp_time_series_batch(locations, concurrency=HTTP_CONCURRENCY):
+    # locations is a list of (lat, lon) tuples, queried concurrently.
+    return gather(dark_sky_temp_time_series, locations, concurrency=concurrency)
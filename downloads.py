@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+import urllib.error
+import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from urllib.parse import urlparse
+
+from http_client import HTTP_RETRY_STATUSES
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_WORKERS = 16
+DOWNLOADS_PER_HOST = 8  # Be nice to NOMADS/AWS/ECMWF, they will throttle or block us otherwise.
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 2  # seconds, doubled after every failed attempt.
+
+def url_host(url):
+    return urlparse(str(url)).netloc or "local"
+
+def transient_error(e):
+    # Connection errors, timeouts, rate limiting and server errors might go away if we try again. Anything
+    # else (e.g. a 404 or a GRIB search string that matches nothing) won't.
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in HTTP_RETRY_STATUSES
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in HTTP_RETRY_STATUSES
+    return isinstance(e, (requests.ConnectionError, requests.Timeout, urllib.error.URLError, ConnectionError, TimeoutError))
+
+def retry_with_backoff(job, description, retries=DOWNLOAD_RETRIES, backoff=DOWNLOAD_BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return job()
+        except Exception as e:
+            if attempt == retries or not transient_error(e):
+                raise
+
+            delay = backoff * 2**attempt
+            logger.warning(f"{description} failed ({e!r}). Retrying in {delay:.1f} s [{attempt+1}/{retries}]...")
+            time.sleep(delay)
+
+def iter_concurrent_downloads(jobs, max_workers=DOWNLOAD_WORKERS, max_per_host=DOWNLOADS_PER_HOST, retries=DOWNLOAD_RETRIES, backoff=DOWNLOAD_BACKOFF):
+    # Each job is a (host, description, callable) tuple. Yields (job index, result, exception) as soon as
+    # each job finishes, with exception None on success. Jobs still queued are cancelled if the consumer
+    # stops iterating early.
+    host_counts = Counter(host for host, _, _ in jobs)
+    host_slots = {host: threading.BoundedSemaphore(max_per_host) for host in host_counts}
+
+    def run(host, description, job):
+        with host_slots[host]:
+            start = time.perf_counter()
+            result = retry_with_backoff(job, description, retries=retries, backoff=backoff)
+            return result, time.perf_counter() - start
+
+    n_jobs = len(jobs)
+    n_failures = 0
+    durations = []
+
+    start = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        futures = {pool.submit(run, *job): n for n, job in enumerate(jobs)}
+
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            n = futures[future]
+            host, description, _ = jobs[n]
+            try:
+                result, duration = future.result()
+            except Exception as e:
+                n_failures += 1
+                logger.error(f"[{n_done}/{n_jobs}] Failed to download {description} from {host}: {e!r}")
+                yield n, None, e
+                continue
+
+            durations.append(duration)
+            logger.info(f"[{n_done}/{n_jobs}] Downloaded {description} from {host} in {duration:.2f} s")
+            yield n, result, None
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    serial = sum(durations)
+    hosts = ", ".join(f"{host} ({count})" for host, count in host_counts.items())
+    logger.info(f"Downloaded {n_jobs - n_failures}/{n_jobs} files in {elapsed:.2f} s "
+                f"(sum of request times {serial:.2f} s, speedup {serial / max(elapsed, 1e-9):.1f}x) from {hosts}")
+
+def concurrent_downloads(jobs, **kwargs):
+    # Results are returned in job order with None for jobs that failed after all retries, and failures
+    # maps job index to the final exception.
+    results = [None] * len(jobs)
+    failures = {}
+
+    for n, result, e in iter_concurrent_downloads(jobs, **kwargs):
+        if e is None:
+            results[n] = result
+        else:
+            failures[n] = e
+
+    return results, failures
+
+# Herbie
+
+def herbie_host(product):
+    return url_host(product.grib)
+
+def herbie_download_jobs(products, fields):
+    return [
+        (herbie_host(product), f"{product.model} {product.date:%Y-%m-%d %HZ} f{product.fxx:02d} {field}", partial(product.download, field, verbose=False))
+        for product in products for field in fields
+    ]
+
+def iter_herbie_downloads(products, fields, **kwargs):
+    # Yields (product index, failed field descriptions) as soon as every field of a product is downloaded,
+    # so it can be processed while later forecast hours are still downloading.
+    jobs = herbie_download_jobs(products, fields)
+    remaining = Counter(n // len(fields) for n in range(len(jobs)))
+    failed = {}
+
+    for n, _, e in iter_concurrent_downloads(jobs, **kwargs):
+        product = n // len(fields)
+        remaining[product] -= 1
+
+        if e is not None:
+            failed.setdefault(product, []).append(jobs[n][1])
+
+        if remaining[product] == 0:
+            yield product, failed.get(product, [])
+
+if __name__ == "__main__":
+    from utils import configure_logging
+    configure_logging()
+
+    # Testing against a local stand-in serving fake GRIB byte ranges.
+    import os
+    import requests
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    GRIB = os.urandom(4 * 2**20)
+    LATENCY = 0.2  # seconds
+
+    class FakeGribHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(LATENCY)
+            first, last = self.headers["Range"].removeprefix("bytes=").split("-")
+            chunk = GRIB[int(first):int(last)+1]
+            self.send_response(206)
+            self.send_header("Content-Length", str(len(chunk)))
+            self.end_headers()
+            self.wfile.write(chunk)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGribHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/gfs.t00z.pgrb2.0p25.f000"
+
+    def byte_range(first, last):
+        response = requests.get(url, headers={"Range": f"bytes={first}-{last}"})
+        response.raise_for_status()
+        return response.content
+
+    ranges = [(n * 2**16, (n+1) * 2**16 - 1) for n in range(49 * 3)]
+    jobs = [(url_host(url), f"bytes={first}-{last}", partial(byte_range, first, last)) for first, last in ranges]
+    results, failures = concurrent_downloads(jobs)
+
+    assert not failures
+    assert b"".join(results) == GRIB[:len(ranges) * 2**16]
+    server.shutdown()
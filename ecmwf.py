@@ -1,63 +1,30 @@
-import logging.config
-import numpy as np
-import pandas as pd
-import xarray as xr
-from herbie import Herbie
-from utils import longitude_east_to_west, K2F, uv2knots, latest_complete_forecast_time, closest_latlon_coordinates
+import logging
+from models import MODELS, model_forecast_stations_dataset, latest_model_forecast_time
+from utils import station_time_series, configure_logging
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
-ECMWF_FORECAST_HOURS = 60
-ECMWF_FORECAST_SPACING = 3  # hours
+# The ECMWF configuration (product, fields, cadence, ...) lives in models.MODELS.
+ECMWF_FORECAST_HOURS = MODELS["ecmwf"]["forecast_hours"]
+ECMWF_FORECAST_SPACING = MODELS["ecmwf"]["outputs"][0][1]  # hours
 
-def merge_ecmwf_fields(product):
-    # We drop the heightAboveGround coordinate since T is at 2m and u,v are at 10m.
-    # We just want to merge the datasets and don't need to keep track of z location.
-    T = product.xarray(":2t:").drop_vars("heightAboveGround")
-    u = product.xarray(":10u:").drop_vars("heightAboveGround")
-    v = product.xarray(":10v:").drop_vars("heightAboveGround")
-    P = product.xarray(":tp:").drop_vars("surface")
+def ecmwf_forecast_stations_dataset(forecast_time, stations, hours=ECMWF_FORECAST_HOURS, fields=None, use_cache=True):
+    return model_forecast_stations_dataset("ecmwf", forecast_time, stations, hours=hours, fields=fields, use_cache=use_cache)
 
-    return xr.merge([T, u, v, P])
+def ecmwf_forecast_time_series(forecast_time, target_lat, target_lon, hours=ECMWF_FORECAST_HOURS, fields=None, use_cache=True):
+    ds = ecmwf_forecast_stations_dataset(forecast_time, [("target", target_lat, target_lon)], hours=hours, fields=fields, use_cache=use_cache)
+    return station_time_series(ds, "target")
 
-def ecmwf_forecast_dataset(forecast_time, fields, hours_range):
-    products = [Herbie(forecast_time, model="ecmwf", product="oper", fxx=h) for h in hours_range]
-    [product.download(field, verbose=True) for field in fields for product in products]
-    ds = xr.concat([merge_ecmwf_fields(product) for product in products], dim="step")
-    return ds
-
-def ecmwf_forecast_time_series(forecast_time, target_lat, target_lon, hours=ECMWF_FORECAST_HOURS, fields=[":2t:", ":10u:", ":10v:", ":tp:"]):
-    target_lon = longitude_east_to_west(target_lon)
-
-    hours_range = range(0, hours+1, ECMWF_FORECAST_SPACING)
-    ds = ecmwf_forecast_dataset(forecast_time, fields, hours_range)
-    x, y = closest_latlon_coordinates(ds, target_lat, target_lon, verbose=True)
-
-    model_times = ds.time + ds.step
-
-    temperature_K = ds.t2m.isel(latitude=x, longitude=y)
-    temperature = K2F(temperature_K)
-
-    u = ds.u10.isel(latitude=x, longitude=y)
-    v = ds.v10.isel(latitude=x, longitude=y)
-    wind_speed = uv2knots(u, v)
-
-    precipitation = ds.tp.isel(latitude=x, longitude=y)
-
-    timeseries = pd.DataFrame({
-        "temperature": temperature,
-        "wind_speed": wind_speed,
-        "precipitation": precipitation
-    }, index=model_times)
-
-    return timeseries
+def latest_ecmwf_forecast_stations_dataset(stations):
+    return ecmwf_forecast_stations_dataset(latest_model_forecast_time("ecmwf"), stations)
 
 def latest_ecmwf_forecast_time_series(lat, lon):
-    forecast_time = latest_complete_forecast_time(n=6, freq_hours=12, model="ecmwf", product="oper", forecast_hours=ECMWF_FORECAST_HOURS)
-    return ecmwf_forecast_time_series(forecast_time, lat, lon)
+    ds = latest_ecmwf_forecast_stations_dataset([("target", lat, lon)])
+    return station_time_series(ds, "target")
 
 if __name__ == "__main__":
+    configure_logging()
+
     # Testing @ Boston
     lat_Boston, lon_Boston = 42.362389, 288.908917
     timeseries = latest_ecmwf_forecast_time_series(lat_Boston, lon_Boston)
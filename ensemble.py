@@ -0,0 +1,133 @@
+import logging
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from models import MODELS, forecast_hours, iter_model_forecast_stations, latest_model_forecast_time
+from points import POINT_INTERPOLATION
+from precipitation import deaccumulate
+from utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+ENSEMBLE_DTYPE = np.float32
+LAGGED_CYCLES = 4
+
+def lagged_forecast_times(model, n_cycles=LAGGED_CYCLES, latest=None, hours=None):
+    # The latest run that's complete out to `hours` (see models.forecast_hours) and the n_cycles - 1 runs
+    # before it, newest first.
+    latest = latest_model_forecast_time(model, hours) if latest is None else pd.Timestamp(latest)
+    cadence = pd.Timedelta(hours=MODELS[model]["cadence_hours"])
+    return [latest - k * cadence for k in range(n_cycles)]
+
+def ensemble_members(model, n_cycles=LAGGED_CYCLES, members=None, latest=None, hours=None):
+    # Every (run, member) pair: the last n_cycles runs of a deterministic model make a time-lagged ensemble
+    # and ensembles (e.g. GEFS) add all of their members, or just `members`, for every run.
+    members = MODELS[model].get("members", [None]) if members is None else members
+    return [(forecast_time, member) for forecast_time in lagged_forecast_times(model, n_cycles, latest=latest, hours=hours) for member in members]
+
+def member_label(forecast_time, member):
+    label = f"{forecast_time:%Y-%m-%d %HZ}"
+    return label if member is None else f"{label} {member}"
+
+def ensemble_stations_array(model, stations, n_cycles=LAGGED_CYCLES, members=None, hours=None, latest=None, use_cache=True, method=POINT_INTERPOLATION):
+    # Returns a (member, lead, station, variable) float32 array with the run and valid time of every member
+    # as coordinates. Precipitation is what fell since the previous lead. Only station values are ever
+    # extracted and each forecast hour goes straight into the array as it arrives, so memory scales with
+    # members x leads x stations and not with the grid. Members that fail to download are logged and left
+    # as NaN.
+    runs = ensemble_members(model, n_cycles=n_cycles, members=members, latest=latest, hours=hours)
+    leads = pd.to_timedelta(list(forecast_hours(model, hours)), unit="h")
+    variables = MODELS[model]["variables"]
+    names = [station for station, _, _ in stations]
+
+    array = np.full((len(runs), len(leads), len(stations), len(variables)), np.nan, dtype=ENSEMBLE_DTYPE)
+    windows = np.full((len(runs), len(leads), len(stations)), np.nan, dtype=ENSEMBLE_DTYPE)
+    failures = {}
+
+    for m, (forecast_time, member) in enumerate(runs):
+        label = member_label(forecast_time, member)
+        logging.info(f"Extracting {model} ensemble member {label} [{m+1}/{len(runs)}]...")
+
+        try:
+            for hour in iter_model_forecast_stations(model, forecast_time, stations, hours=hours, use_cache=use_cache, method=method, member=member):
+                lead = leads.get_loc(pd.Timestamp(hour.time.values) - forecast_time)
+                array[m, lead] = np.stack([hour[variable].values if variable in hour else np.full(len(stations), np.nan) for variable in variables], axis=-1)
+                if "precipitation_hours" in hour:
+                    windows[m, lead] = hour["precipitation_hours"].values
+        except Exception as e:
+            failures[label] = e
+            logging.error(f"{model} ensemble member {label} failed: {e!r}")
+
+    if failures:
+        logging.warning(f"{len(failures)}/{len(runs)} {model} ensemble members failed: {', '.join(failures)}")
+
+    # Every member shares the same leads so all of them are de-accumulated at once.
+    if "precipitation" in variables:
+        p = variables.index("precipitation")
+        steps = leads / pd.Timedelta(hours=1)
+        amounts = deaccumulate(np.moveaxis(array[..., p], 1, 0), np.moveaxis(windows, 1, 0), steps)
+        array[..., p] = np.moveaxis(amounts, 0, 1)
+
+    run_times = pd.DatetimeIndex([forecast_time for forecast_time, _ in runs])
+
+    return xr.DataArray(
+        array,
+        dims=("member", "lead", "station", "variable"),
+        coords={
+            "member": [member_label(forecast_time, member) for forecast_time, member in runs],
+            "lead": leads,
+            "station": names,
+            "variable": variables,
+            "run": ("member", run_times),
+            "valid_time": (("member", "lead"), run_times.values[:, None] + leads.values[None, :])
+        },
+        name=model
+    )
+
+def ensemble_by_valid_time(array):
+    # Lagged members forecast the same valid times at different leads. Returns a (member, time, station,
+    # variable) array on the union of all valid times, NaN where a member doesn't reach a time.
+    times, positions = np.unique(array.valid_time.values, return_inverse=True)
+    positions = positions.reshape(array.valid_time.shape)
+
+    values = np.full((array.sizes["member"], len(times), array.sizes["station"], array.sizes["variable"]), np.nan, dtype=array.dtype)
+    values[np.arange(array.sizes["member"])[:, None], positions] = array.values
+
+    return xr.DataArray(
+        values,
+        dims=("member", "time", "station", "variable"),
+        coords={
+            "member": array["member"].values,
+            "time": times,
+            "station": array["station"].values,
+            "variable": array["variable"].values,  # Not array.variable, that's the DataArray's data.
+            "run": ("member", array["run"].values)
+        },
+        name=array.name
+    )
+
+def ensemble_statistics(array, quantiles=(0.1, 0.5, 0.9)):
+    # Mean, spread and quantiles over members by valid time, ignoring members that don't cover a time.
+    by_time = ensemble_by_valid_time(array)
+    return xr.Dataset({
+        "mean": by_time.mean("member"),
+        "spread": by_time.std("member"),
+        "quantiles": by_time.quantile(list(quantiles), dim="member"),
+        "count": by_time.notnull().sum("member")
+    })
+
+def ensemble_mean_stations_dataset(model, stations, n_cycles=LAGGED_CYCLES, members=None):
+    # The ensemble mean as a (time, station) dataset like every other forecast source.
+    mean = ensemble_statistics(ensemble_stations_array(model, stations, n_cycles=n_cycles, members=members))["mean"]
+    return mean.astype(np.float64).to_dataset("variable").dropna("time", how="all")
+
+if __name__ == "__main__":
+    configure_logging()
+
+    # Testing @ Boston
+    lat_Boston, lon_Boston = 42.362389, 288.908917
+    array = ensemble_stations_array("hrrr", [("KBOS", lat_Boston, lon_Boston)], n_cycles=4)
+    print(array)
+    print(f"{array.nbytes / 2**10:.1f} KiB")
+    print(ensemble_statistics(array)["mean"].sel(station="KBOS").to_pandas())
@@ -1,171 +1,233 @@
-import logging.config
+import sys
+import logging
+import importlib
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
-import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
 
-from hrrr import latest_hrrr_forecast_time_series
-from gfs import latest_gfs_forecast_time_series
-from nam import latest_nam_forecast_time_series
-from ecmwf import latest_ecmwf_forecast_time_series
-from nws import nws_forecast_time_series
+from plotting import new_figure, save_figure, format_6Z_axis, render_plots
+from utils import compute_6Z_times, station_time_series, configure_logging
+from consensus import consensus_dataset
+from window_statistics import window_statistics, datasets_frame, window_rows
 
-from utils import compute_6Z_times, timeseries_max, timeseries_min_and_max
-
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
-def temperature_label(model, temperature, t1, t2):
-    ts = temperature[t1:t2]
-
-    if ts.size == 0:
+# Sources are given as "module:function[:argument...]" and only imported when they're fetched, so e.g. an
+# NWS-only run never loads Herbie, ecCodes or any of the model modules. Arguments like name=value are passed
+# by keyword, e.g. method picks how model values are interpolated to the stations (see grid_index.INTERPOLATION_METHODS).
+# NWP models come from models.MODELS; registered models that aren't fetched by default (e.g. RAP) can be
+# added with model_source.
+FORECAST_SOURCES = {
+    "hrrr": "models:latest_model_forecast_stations_dataset:hrrr:method=nearest",
+    "nam": "models:latest_model_forecast_stations_dataset:nam:method=nearest",
+    "gfs": "models:latest_model_forecast_stations_dataset:gfs:method=nearest",
+    "ecmwf": "models:latest_model_forecast_stations_dataset:ecmwf:method=nearest",
+    "nws": "nws:nws_forecast_stations_dataset"
+}
+
+SOURCE_LABELS = {
+    "hrrr": "HRRR",
+    "nam": "NAM 5km",
+    "gfs": "GFS 0.25°",
+    "ecmwf": "ECMWF 0.4°",
+    "nws": "NWS",
+    "consensus": "Consensus"
+}
+
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
+
+def temperature_label(model, stats):
+    # stats are the source's statistics for the forecast window (None if it has none).
+    if stats is None or pd.isna(stats.get("temperature_min")):
         return f"{model}"
     else:
-        t_min, T_min, t_max, T_max = timeseries_min_and_max(ts)
-        t_min_txt = t_min.strftime("%m/%d %H:%M")
-        t_max_txt = t_max.strftime("%m/%d %H:%M")
-        return f"{model} (min: {T_min:.1f}°F @ {t_min_txt}Z, max: {T_max:.1f}°F @ {t_max_txt}Z)"
+        t_min_txt = stats["temperature_min_time"].strftime("%m/%d %H:%M")
+        t_max_txt = stats["temperature_max_time"].strftime("%m/%d %H:%M")
+        return f"{model} (min: {stats['temperature_min']:.1f}°F @ {t_min_txt}Z, max: {stats['temperature_max']:.1f}°F @ {t_max_txt}Z)"
 
-def wind_speed_label(model, wind_speed, t1, t2):
-    ts = wind_speed[t1:t2]
+def wind_speed_label(model, stats):
+    if stats is None or pd.isna(stats.get("wind_speed_max")):
+        return f"{model}"
+    else:
+        t_max_txt = stats["wind_speed_max_time"].strftime("%m/%d %H:%M")
+        return f"{model} (max: {stats['wind_speed_max']:.1f} mph @ {t_max_txt}Z)"
 
-    if ts.size == 0:
+def precipitation_label(model, stats):
+    if stats is None or pd.isna(stats.get("precipitation_sum")):
         return f"{model}"
     else:
-        t_max, s_max = timeseries_max(ts)
-        t_max_txt = t_max.strftime("%m/%d %H:%M")
-        return f"{model} (max: {s_max:.1f} mph @ {t_max_txt}Z)"
+        return f"{model} (total: {stats['precipitation_sum']:.2f} in)"
 
-def plot_temperature_forecast(timeseries, station, filepath):
-    first_6Z, second_6Z = compute_6Z_times()
+def model_source(model, method="nearest"):
+    return f"models:latest_model_forecast_stations_dataset:{model}:method={method}"
 
-    fig = plt.figure(figsize=(16, 9))
-    ax = plt.subplot(111)
+def source_label(source):
+    return SOURCE_LABELS.get(source, source.upper())
 
-    label_hrrr = temperature_label("HRRR", timeseries["hrrr"]["temperature"], first_6Z, second_6Z)
-    label_nam = temperature_label("NAM 5km", timeseries["nam"]["temperature"], first_6Z, second_6Z)
-    label_gfs = temperature_label("GFS 0.25°", timeseries["gfs"]["temperature"], first_6Z, second_6Z)
-    label_ecmwf = temperature_label("ECMWF 0.4°", timeseries["ecmwf"]["temperature"], first_6Z, second_6Z)
-    label_nws = temperature_label("NWS", timeseries["nws"]["temperature"], first_6Z, second_6Z)
+def source_stats(stats, source):
+    return stats.loc[source] if source in stats.index else None
 
-    ax.plot(timeseries["hrrr"]["temperature"], marker="o", label=label_hrrr)
-    ax.plot(timeseries["nam"]["temperature"], marker="o", label=label_nam)
-    ax.plot(timeseries["gfs"]["temperature"], marker="o", label=label_gfs)
-    ax.plot(timeseries["ecmwf"]["temperature"], marker="o", label=label_ecmwf)
-    ax.plot(timeseries["nws"]["temperature"], marker="o", label=label_nws)
+def available_series(timeseries, variable):
+    # Sources that failed to fetch or don't provide this variable (e.g. GFS and NWS precipitation) are skipped.
+    # Labelled sources are plotted in their usual order (and colors), any other model before the consensus.
+    others = [source for source in timeseries if source not in SOURCE_LABELS]
+    order = [source for source in SOURCE_LABELS if source != "consensus"] + others + ["consensus"]
+    return [(source, timeseries[source][variable]) for source in order
+            if source in timeseries and variable in timeseries[source]]
 
-    ax.axvline(x=first_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-    ax.axvline(x=second_6Z, ymin=0, ymax=1, color="red", linestyle="--")
+def plot_temperature_forecast(timeseries, stats, station, first_6Z, second_6Z, filepath):
+    fig = new_figure()
+    ax = fig.add_subplot(111)
 
-    # Focus on the 6Z-6Z range.
-    plt.xlim([first_6Z - pd.Timedelta(hours=6), second_6Z + pd.Timedelta(hours=6)])
+    for source, temperature in available_series(timeseries, "temperature"):
+        label = temperature_label(source_label(source), source_stats(stats, source))
+        ax.plot(temperature, marker="o", label=label)
 
-    # Nicer date formatting.
-    formatter = DateFormatter('%m/%d %HZ')
-    ax.xaxis.set_major_formatter(formatter)
-    ax.xaxis.set_tick_params(rotation=30, labelsize=11)
+    format_6Z_axis(ax, first_6Z, second_6Z)
 
-    plt.title(f"Temperature forecast for {station}")
-    plt.xlabel("Time (UTC)")
-    plt.ylabel("Temperature (°F)")
+    ax.set_title(f"Temperature forecast for {station}")
+    ax.set_xlabel("Time (UTC)")
+    ax.set_ylabel("Temperature (°F)")
 
-    plt.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.15), frameon=False)
-    plt.grid(which="both")
+    ax.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.15), frameon=False)
+    ax.grid(which="both")
 
-    logging.info(f"Saving {filepath}...")
-    plt.savefig(filepath)
+    save_figure(fig, filepath)
 
-def plot_wind_speed_forecast(timeseries, station, filepath):
-    first_6Z, second_6Z = compute_6Z_times()
+def plot_wind_speed_forecast(timeseries, stats, station, first_6Z, second_6Z, filepath):
+    fig = new_figure()
+    ax = fig.add_subplot(111)
 
-    fig = plt.figure(figsize=(16, 9))
-    ax = plt.subplot(111)
+    for source, wind_speed in available_series(timeseries, "wind_speed"):
+        label = wind_speed_label(source_label(source), source_stats(stats, source))
+        ax.plot(wind_speed, marker="o", label=label)
 
-    label_hrrr = wind_speed_label("HRRR", timeseries["hrrr"]["wind_speed"], first_6Z, second_6Z)
-    label_nam = wind_speed_label("NAM 5km", timeseries["nam"]["wind_speed"], first_6Z, second_6Z)
-    label_gfs = wind_speed_label("GFS 0.25°", timeseries["gfs"]["wind_speed"], first_6Z, second_6Z)
-    label_ecmwf = wind_speed_label("ECMWF 0.4°", timeseries["ecmwf"]["wind_speed"], first_6Z, second_6Z)
-    label_nws = wind_speed_label("NWS", timeseries["nws"]["wind_speed"], first_6Z, second_6Z)
+    format_6Z_axis(ax, first_6Z, second_6Z)
 
-    ax.plot(timeseries["hrrr"]["wind_speed"], marker="o", label=label_hrrr)
-    ax.plot(timeseries["nam"]["wind_speed"], marker="o", label=label_nam)
-    ax.plot(timeseries["gfs"]["wind_speed"], marker="o", label=label_gfs)
-    ax.plot(timeseries["ecmwf"]["wind_speed"], marker="o", label=label_ecmwf)
-    ax.plot(timeseries["nws"]["wind_speed"], marker="o", label=label_nws)
+    ax.set_title(f"Wind speed forecast for {station}")
+    ax.set_xlabel("Time (UTC)")
+    ax.set_ylabel("Wind speed (mph)")
 
-    ax.axvline(x=first_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-    ax.axvline(x=second_6Z, ymin=0, ymax=1, color="red", linestyle="--")
+    ax.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.1), frameon=False)
+    ax.grid(which="both")
 
-    # Focus on the 6Z-6Z range.
-    plt.xlim([first_6Z - pd.Timedelta(hours=6), second_6Z + pd.Timedelta(hours=6)])
+    save_figure(fig, filepath)
 
-    # Nicer date formatting.
-    formatter = DateFormatter('%m/%d %HZ')
-    ax.xaxis.set_major_formatter(formatter)
-    ax.xaxis.set_tick_params(rotation=30, labelsize=11)
+def plot_precipitation_forecast(timeseries, stats, station, first_6Z, second_6Z, filepath):
+    fig = new_figure()
+    ax = fig.add_subplot(111)
 
-    plt.title(f"Wind speed forecast for {station}")
-    plt.xlabel("Time (UTC)")
-    plt.ylabel("Wind speed (mph)")
+    # Every source's precipitation is what fell since its previous time, whatever its output interval, so
+    # running totals over the window are comparable and end at the window total.
+    for source, precipitation in available_series(timeseries, "precipitation"):
+        label = precipitation_label(source_label(source), source_stats(stats, source))
+        window = precipitation[(precipitation.index > first_6Z) & (precipitation.index <= second_6Z)].dropna()
+        if window.empty:
+            continue
 
-    plt.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.1), frameon=False)
-    plt.grid(which="both")
+        total = pd.concat([pd.Series([0.0], index=[first_6Z]), window.cumsum()])
+        ax.plot(total, marker="o", label=label)
 
-    logging.info(f"Saving {filepath}...")
-    plt.savefig(filepath)
+    format_6Z_axis(ax, first_6Z, second_6Z)
 
-def plot_precipitation_forecast(timeseries, station, filepath):
-    first_6Z, second_6Z = compute_6Z_times()
+    ax.set_title(f"Precipitation forecast for {station}")
+    ax.set_xlabel("Time (UTC)")
+    ax.set_ylabel("Accumulated precipitation (in)")
 
-    fig = plt.figure(figsize=(16, 9))
-    ax = plt.subplot(111)
+    ax.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.1), frameon=False)
+    ax.grid(which="both")
 
-    # label_hrrr = wind_speed_label("HRRR", ts_hrrr["time"], ts_hrrr["wind_speed"], first_6Z, second_6Z)
-    # label_nam = wind_speed_label("NAM 5km", ts_nam["time"], ts_nam["wind_speed"], first_6Z, second_6Z)
+    save_figure(fig, filepath)
 
-    ax.plot(timeseries["hrrr"]["precipitation"], marker="o", label="HRRR")
-    ax.plot(timeseries["nam"]["precipitation"], marker="o", label="NAM 5km")
-    ax.plot(timeseries["ecmwf"]["precipitation"], marker="o", label="ECMWF 0.4°")
+def load_source(fetch):
+    if callable(fetch):
+        return fetch
 
-    # plot cumsum of precip.
+    module, function, *args = fetch.split(":")
+    kwargs = dict(arg.split("=", 1) for arg in args if "=" in arg)
+    args = [arg for arg in args if "=" not in arg]
+    return partial(getattr(importlib.import_module(module), function), *args, **kwargs)
 
-    ax.axvline(x=first_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-    ax.axvline(x=second_6Z, ymin=0, ymax=1, color="red", linestyle="--")
+def fetch_forecast_datasets(stations, sources=FORECAST_SOURCES, executor="thread", max_workers=None):
+    # Each source is fetched once for all stations, so every GRIB message is downloaded and decoded once
+    # no matter how many stations we forecast for. The sources share no state so we fetch them all at once.
+    # A failing source is logged and reported in `failures` instead of taking down the whole forecast.
+    datasets = {}
+    failures = {}
+    sources = {source: load_source(fetch) for source, fetch in sources.items()}
 
-    # Focus on the 6Z-6Z range.
-    plt.xlim([first_6Z - pd.Timedelta(hours=6), second_6Z + pd.Timedelta(hours=6)])
+    if executor == "serial":
+        for source, fetch in sources.items():
+            try:
+                datasets[source] = fetch(stations)
+            except Exception as e:
+                logging.error(f"Failed to fetch {source} forecast: {e!r}")
+                failures[source] = e
+        return datasets, failures
 
-    # Nicer date formatting.
-    formatter = DateFormatter('%m/%d %HZ')
-    ax.xaxis.set_major_formatter(formatter)
-    ax.xaxis.set_tick_params(rotation=30, labelsize=11)
+    max_workers = max_workers or len(sources)
+    logging.info(f"Fetching {len(sources)} forecast sources for {len(stations)} stations ({executor} pool, max_workers={max_workers})...")
+
+    with EXECUTORS[executor](max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, stations): source for source, fetch in sources.items()}
 
-    plt.title(f"Precipitation forecast for {station}")
-    plt.xlabel("Time (UTC)")
-    plt.ylabel("Precipitation")
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                datasets[source] = future.result()
+                logging.info(f"Fetched {source} forecast.")
+            except Exception as e:
+                logging.error(f"Failed to fetch {source} forecast: {e!r}")
+                failures[source] = e
 
-    plt.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.1), frameon=False)
-    plt.grid(which="both")
+    return datasets, failures
 
-    logging.info(f"Saving {filepath}...")
-    plt.savefig(filepath)
+def forecast_time_series(datasets, station):
+    return {source: station_time_series(ds, station).dropna(how="all") for source, ds in datasets.items()}
 
-def generate_forecast(station, lat, lon):
+def fetch_forecast_time_series(lat, lon, sources=FORECAST_SOURCES, executor="thread", max_workers=None):
+    datasets, failures = fetch_forecast_datasets([("target", lat, lon)], sources=sources, executor=executor, max_workers=max_workers)
+    return forecast_time_series(datasets, "target"), failures
+
+def generate_forecasts(stations, sources=FORECAST_SOURCES, executor="thread", max_workers=None, plot_executor="serial"):
+    # stations is a list of (station, lat, lon) tuples.
     now = pd.Timestamp.now()
 
-    timeseries = {
-        "hrrr": latest_hrrr_forecast_time_series(lat, lon),
-        "nam": latest_nam_forecast_time_series(lat, lon),
-        "gfs": latest_gfs_forecast_time_series(lat, lon),
-        "ecmwf": latest_ecmwf_forecast_time_series(lat, lon),
-        "nws": nws_forecast_time_series(lat, lon)
-    }
+    datasets, failures = fetch_forecast_datasets(stations, sources=sources, executor=executor, max_workers=max_workers)
+
+    if failures:
+        logging.warning(f"Plotting forecasts without: {', '.join(failures)}")
+
+    if len(datasets) > 1:
+        datasets["consensus"] = consensus_dataset(datasets)
+
+    # Window statistics for every source and station in one go, the plots just look them up.
+    first_6Z, second_6Z = compute_6Z_times()
+    stats = window_statistics(datasets_frame(datasets)) if datasets else None
 
     nowstr = now.strftime("%Y-%m-%d_%H%M%S")
-    plot_temperature_forecast(timeseries, station, f"temperature_forecast_{station}_{nowstr}.png")
-    plot_wind_speed_forecast(timeseries, station, f"wind_speed_forecast_{station}_{nowstr}.png")
-    plot_precipitation_forecast(timeseries, station, f"precipitation_forecast_{station}_{nowstr}.png")
+    plots = []
+
+    for station, _, _ in stations:
+        timeseries = forecast_time_series(datasets, station)
+        station_stats = window_rows(stats, station, first_6Z) if stats is not None else pd.DataFrame()
+        window = (station_stats, station, first_6Z, second_6Z)
+        plots += [
+            (plot_temperature_forecast, (timeseries, *window, f"temperature_forecast_{station}_{nowstr}.png")),
+            (plot_wind_speed_forecast, (timeseries, *window, f"wind_speed_forecast_{station}_{nowstr}.png")),
+            (plot_precipitation_forecast, (timeseries, *window, f"precipitation_forecast_{station}_{nowstr}.png"))
+        ]
+
+    render_plots(plots, executor=plot_executor)
+
+    return failures
+
+def generate_forecast(station, lat, lon, sources=FORECAST_SOURCES, executor="thread", max_workers=None, plot_executor="serial"):
+    return generate_forecasts([(station, lat, lon)], sources=sources, executor=executor, max_workers=max_workers, plot_executor=plot_executor)
 
 
 if __name__ == "__main__":
@@ -173,7 +235,13 @@ if __name__ == "__main__":
     # lat, lon = 42.362389, 288.908917
     # station = "KBOS"
 
+    configure_logging()
+
     # Fort Myers
     station = "KFMY"
     lat, lon = 26.5866150, 278.1367531
-    generate_forecast(station, lat, lon)
+
+    # Optionally pick sources on the command line, e.g. `python generate_forecast.py nws` for a quick check
+    # or `python generate_forecast.py hrrr rap nam gfs ecmwf nws` to add RAP.
+    sources = {source: FORECAST_SOURCES.get(source, model_source(source)) for source in sys.argv[1:]} or FORECAST_SOURCES
+    generate_forecast(station, lat, lon, sources=sources)
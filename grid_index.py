@@ -0,0 +1,287 @@
+import os
+import glob
+import hashlib
+import logging
+import pickle
+import numpy as np
+
+from scipy import sparse
+from scipy.spatial import cKDTree
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+GRID_INDEX_DIRECTORY = "grid_indices"
+WEIGHTS_MAX_BYTES = 64 * 2**20  # 64 MiB of interpolation weights, every station list and method gets its own file.
+EARTH_RADIUS = 6371.228e3  # meters, same as utils.haversine_distance
+
+# Ways of turning grid point values into a value at a station. bilinear and neighbourhood need the
+# grid's 2D structure, nearest and idw (inverse distance weighting) work on any grid.
+INTERPOLATION_METHODS = ("nearest", "idw", "bilinear", "neighbourhood")
+STRUCTURED_METHODS = ("bilinear", "neighbourhood")
+IDW_NEIGHBOURS = 4
+IDW_POWER = 2
+NEIGHBOURHOOD_SIZE = 3  # k for a k x k neighbourhood of grid points centred on the nearest one.
+BILINEAR_ITERATIONS = 8
+
+# Grid indices and interpolation weights already loaded by this process, keyed like their files.
+_grid_indices = {}
+_weights = {}
+
+def unit_vectors(lats, lons):
+    # Nearest neighbours between points on the unit sphere in 3D are great-circle nearest neighbours,
+    # and there's no longitude wrap-around or convention (0-360 vs. -180-180) to worry about.
+    lats = np.deg2rad(np.asarray(lats, dtype=np.float64).ravel())
+    lons = np.deg2rad(np.asarray(lons, dtype=np.float64).ravel())
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+def grid_key(lats, lons):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(lats, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(lons, dtype=np.float64).tobytes())
+    shape = "x".join(str(n) for n in np.shape(lats))
+    return f"{shape}_{digest.hexdigest()[:16]}"
+
+def grid_index_filepath(key):
+    return os.path.join(GRID_INDEX_DIRECTORY, f"grid_index_{key}.pickle")
+
+def load_grid_index(key):
+    if key in _grid_indices:
+        return _grid_indices[key]
+
+    filepath = grid_index_filepath(key)
+    if not os.path.exists(filepath):
+        return None
+
+    with open(filepath, "rb") as handle:
+        index = pickle.load(handle)
+
+    _grid_indices[key] = index
+    return index
+
+def build_grid_index(lats, lons, key=None):
+    # `key` identifies the grid definition. When it's not given we hash the coordinates themselves.
+    key = key or grid_key(lats, lons)
+
+    index = load_grid_index(key)
+    if index is not None:
+        return index
+
+    logging.info(f"Building grid index for {np.size(lats)} grid points (key={key})...")
+
+    index = {
+        "key": key,
+        "shape": np.shape(lats),
+        "latitudes": np.asarray(lats).ravel(),
+        "longitudes": np.asarray(lons).ravel(),
+        "tree": cKDTree(unit_vectors(lats, lons))
+    }
+
+    store_grid_index(index)
+    _grid_indices[key] = index
+    return index
+
+def store_grid_index(index):
+    filepath = grid_index_filepath(index["key"])
+    os.makedirs(GRID_INDEX_DIRECTORY, exist_ok=True)
+    with atomic_write(filepath, "wb") as handle:
+        pickle.dump(index, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+def nearest_grid_points(index, target_lats, target_lons):
+    # Returns flat indices (into the raveled grid) of the great-circle nearest grid points and their distances in meters.
+    chords, n = index["tree"].query(unit_vectors(target_lats, target_lons))
+    distances = 2 * EARTH_RADIUS * np.arcsin(np.minimum(chords / 2, 1))
+    return n, distances
+
+def weights_matrix(index, rows, columns, weights):
+    # One row per target, one column per grid point. Duplicate (row, column) entries add up.
+    shape = (len(weights), int(np.prod(index["shape"])))
+    W = sparse.csr_matrix((np.ravel(weights), (np.ravel(rows), np.ravel(columns))), shape=shape)
+    W.eliminate_zeros()
+    return W
+
+def nearest_weights(index, target_lats, target_lons):
+    n, _ = nearest_grid_points(index, target_lats, target_lons)
+    return weights_matrix(index, np.arange(len(n)), n, np.ones(len(n)))
+
+def idw_weights(index, target_lats, target_lons, k=IDW_NEIGHBOURS, power=IDW_POWER):
+    chords, n = index["tree"].query(unit_vectors(target_lats, target_lons), k=k)
+    distances = 2 * EARTH_RADIUS * np.arcsin(np.minimum(chords / 2, 1))
+
+    # A target sitting right on a grid point just takes its value.
+    exact = distances[:, :1] < 1
+    weights = np.where(exact, (np.arange(k) == 0).astype(np.float64), 1 / np.maximum(distances, 1)**power)
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    return weights_matrix(index, np.repeat(np.arange(len(n)), k), n, weights)
+
+def structured_shape(index):
+    if len(index["shape"]) != 2:
+        raise ValueError(f"Grid {index['key']} has no 2D structure (shape={index['shape']}), use nearest or idw.")
+    return index["shape"]
+
+def neighbourhood_grid_points(index, target_lats, target_lons, size=NEIGHBOURHOOD_SIZE):
+    # Flat indices of the size x size grid points centred on each target's nearest grid point, one row per
+    # target, with -1 where the neighbourhood hangs over the edge of the grid.
+    shape = structured_shape(index)
+    n, _ = nearest_grid_points(index, target_lats, target_lons)
+    i, j = np.unravel_index(n, shape)
+
+    offsets = np.arange(size) - size // 2
+    di, dj = [o.ravel() for o in np.meshgrid(offsets, offsets, indexing="ij")]
+    I, J = i[:, None] + di, j[:, None] + dj
+
+    inside = (I >= 0) & (I < shape[0]) & (J >= 0) & (J < shape[1])
+    flat = np.ravel_multi_index((np.clip(I, 0, shape[0] - 1), np.clip(J, 0, shape[1] - 1)), shape)
+    return np.where(inside, flat, -1)
+
+def neighbourhood_weights(index, target_lats, target_lons, size=NEIGHBOURHOOD_SIZE):
+    neighbours = neighbourhood_grid_points(index, target_lats, target_lons, size=size)
+    inside = neighbours >= 0
+    weights = inside / inside.sum(axis=1, keepdims=True)
+    rows = np.repeat(np.arange(len(neighbours)), neighbours.shape[1])
+    return weights_matrix(index, rows, np.where(inside, neighbours, 0), weights)
+
+def local_coordinates(lats, lons, lat0, lon0):
+    # Meters east and north of (lat0, lon0) on a plane tangent there. Plenty accurate within a grid cell.
+    dlon = (np.asarray(lons) - lon0 + 180) % 360 - 180
+    x = EARTH_RADIUS * np.cos(np.deg2rad(lat0)) * np.deg2rad(dlon)
+    y = EARTH_RADIUS * np.deg2rad(np.asarray(lats) - lat0)
+    return x, y
+
+def invert_bilinear(x, y, iterations=BILINEAR_ITERATIONS):
+    # x, y hold the corners (0, 0), (0, 1), (1, 0), (1, 1) of one cell per row relative to the target. Solves
+    # (1-s)(1-t) p00 + s(1-t) p01 + (1-s)t p10 + st p11 = 0 for the target's cell coordinates (s, t) with
+    # Newton's method, which also handles the non-rectangular cells of projected grids.
+    a = np.stack([x[:, 0], y[:, 0]])
+    b = np.stack([x[:, 1] - x[:, 0], y[:, 1] - y[:, 0]])
+    c = np.stack([x[:, 2] - x[:, 0], y[:, 2] - y[:, 0]])
+    d = np.stack([x[:, 3] - x[:, 2] - x[:, 1] + x[:, 0], y[:, 3] - y[:, 2] - y[:, 1] + y[:, 0]])
+
+    s = np.full(x.shape[0], 0.5)
+    t = np.full(x.shape[0], 0.5)
+
+    for _ in range(iterations):
+        r = a + b*s + c*t + d*s*t
+        dP_ds, dP_dt = b + d*t, c + d*s
+        determinant = dP_ds[0] * dP_dt[1] - dP_dt[0] * dP_ds[1]
+        determinant = np.where(determinant == 0, np.nan, determinant)
+        s = s - (dP_dt[1] * r[0] - dP_dt[0] * r[1]) / determinant
+        t = t - (dP_ds[0] * r[1] - dP_ds[1] * r[0]) / determinant
+
+    return s, t
+
+def bilinear_weights(index, target_lats, target_lons, tolerance=1e-6):
+    # The target lies in one of the four cells sharing its nearest grid point. Targets outside the grid
+    # fall back to the nearest grid point.
+    shape = structured_shape(index)
+    target_lats = np.asarray(target_lats, dtype=np.float64).ravel()
+    target_lons = np.asarray(target_lons, dtype=np.float64).ravel()
+
+    n, _ = nearest_grid_points(index, target_lats, target_lons)
+    i, j = np.unravel_index(n, shape)
+
+    columns = np.repeat(n[:, None], 4, axis=1)
+    weights = np.tile([1.0, 0, 0, 0], (len(n), 1))
+    found = np.zeros(len(n), dtype=bool)
+
+    for di, dj in [(0, 0), (-1, 0), (0, -1), (-1, -1)]:
+        i0 = np.clip(i + di, 0, shape[0] - 2)
+        j0 = np.clip(j + dj, 0, shape[1] - 2)
+        corners = np.stack([np.ravel_multi_index((i0 + ci, j0 + cj), shape) for ci, cj in [(0, 0), (0, 1), (1, 0), (1, 1)]], axis=1)
+
+        x, y = local_coordinates(index["latitudes"][corners], index["longitudes"][corners], target_lats[:, None], target_lons[:, None])
+        s, t = invert_bilinear(x, y)
+
+        inside = ~found & (s >= -tolerance) & (s <= 1 + tolerance) & (t >= -tolerance) & (t <= 1 + tolerance)
+        s, t = np.clip(s, 0, 1), np.clip(t, 0, 1)
+
+        columns[inside] = corners[inside]
+        weights[inside] = np.stack([(1-s)*(1-t), s*(1-t), (1-s)*t, s*t], axis=1)[inside]
+        found |= inside
+
+    if not found.all():
+        logging.warning(f"{(~found).sum()}/{len(found)} targets are outside grid {index['key']}, using the nearest grid point.")
+
+    return weights_matrix(index, np.repeat(np.arange(len(n)), 4), columns, weights)
+
+WEIGHT_FUNCTIONS = {
+    "nearest": nearest_weights,
+    "idw": idw_weights,
+    "bilinear": bilinear_weights,
+    "neighbourhood": neighbourhood_weights
+}
+
+def weights_key(index, target_lats, target_lons, method, **kwargs):
+    digest = hashlib.sha1(np.concatenate([target_lats, target_lons]).tobytes())
+    digest.update(repr(sorted(kwargs.items())).encode())
+    return f"{index['key']}_{method}_{digest.hexdigest()[:16]}"
+
+def weights_filepath(key):
+    return os.path.join(GRID_INDEX_DIRECTORY, f"weights_{key}.npz")
+
+def interpolation_weights(index, target_lats, target_lons, method="nearest", **kwargs):
+    # A sparse (targets x grid points) matrix W so that W @ values gives the interpolated value at every
+    # target for a field's values in scanning order. The weights only depend on the grid and the targets so
+    # every forecast hour of every run reuses them. Each set of weights is a small file of its own next to
+    # the grid index, which is never written again and can be shared by threads as is.
+    if method not in WEIGHT_FUNCTIONS:
+        raise ValueError(f"Unknown interpolation method: {method}. Choose from {INTERPOLATION_METHODS}.")
+
+    target_lats = np.asarray(target_lats, dtype=np.float64).ravel()
+    target_lons = np.asarray(target_lons, dtype=np.float64).ravel()
+    key = weights_key(index, target_lats, target_lons, method, **kwargs)
+
+    if key in _weights:
+        return _weights[key]
+
+    filepath = weights_filepath(key)
+    if os.path.exists(filepath):
+        W = sparse.load_npz(filepath).tocsr()
+        os.utime(filepath)  # Mark as recently used for LRU eviction.
+    else:
+        W = WEIGHT_FUNCTIONS[method](index, target_lats, target_lons, **kwargs)
+        os.makedirs(GRID_INDEX_DIRECTORY, exist_ok=True)
+        with atomic_write(filepath, "wb") as f:
+            sparse.save_npz(f, W)
+
+    _weights[key] = W
+    return W
+
+def evict_interpolation_weights(max_bytes=WEIGHTS_MAX_BYTES):
+    # Least recently used weights go first until they fit in max_bytes, like the point cache. Grid indices
+    # themselves are kept, there's only one per grid.
+    entries = []
+    for filepath in glob.glob(weights_filepath("*")):
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            continue  # Evicted by another worker.
+        entries.append((stat.st_mtime, stat.st_size, filepath))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+
+    for _, size, filepath in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass  # Another worker got to it first.
+        total -= size
+        evicted += 1
+
+    if evicted:
+        logging.info(f"Evicted {evicted} interpolation weights ({total / 2**20:.1f} MiB left).")
+
+def neighbourhood_statistics(values, neighbours):
+    # values are a field's values at the points `neighbours` index (-1 = off the grid), one row of
+    # neighbours per target. Returns the min, mean, max and standard deviation over each neighbourhood.
+    gathered = np.where(neighbours >= 0, np.asarray(values, dtype=np.float64)[np.maximum(neighbours, 0)], np.nan)
+    return {
+        "min": np.nanmin(gathered, axis=1),
+        "mean": np.nanmean(gathered, axis=1),
+        "max": np.nanmax(gathered, axis=1),
+        "std": np.nanstd(gathered, axis=1)
+    }
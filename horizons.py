@@ -0,0 +1,92 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How finely we want forecast hours as (up to hour, every n hours) segments: hourly while it matters for
+# the WxChallenge window, then 3-hourly out to day 5 and 6-hourly out to day 7.
+MEDIUM_RANGE_RESOLUTION = [(48, 1), (120, 3), (168, 6)]
+MEDIUM_RANGE_HOURS = 168
+
+FORECAST_BYTE_BUDGET = 512 * 2**20  # bytes of GRIB subsets per model run.
+MAX_SPACING_HOURS = 24  # We'd rather truncate the horizon than go coarser than daily.
+
+# Spacings we coarsen through. They all divide a day so forecast hours keep lining up with the 6Z-6Z
+# windows (see window_statistics) however far a plan gets thinned out. Products that accumulate
+# precipitation in buckets (e.g. NAM every 3 hours) only get the spacings that divide their bucket, since
+# precipitation.deaccumulate needs the end of every bucket to subtract from the next one.
+SPACING_HOURS = [1, 2, 3, 6, 12, 24]
+
+def published_hours(outputs, horizon):
+    # outputs are a product's (up to hour, every n hours) segments, e.g. GFS is hourly out to 120 hours and
+    # 3-hourly after that. Returns every forecast hour it publishes up to horizon.
+    hours = []
+    previous = None
+    for until, spacing in outputs:
+        start = 0 if previous is None else previous + spacing
+        hours += range(start, min(until, horizon) + 1, spacing)
+        previous = until
+    return hours
+
+def spacing_at(resolution, hour):
+    for until, spacing in resolution:
+        if hour <= until:
+            return spacing
+    return None  # Past the end of the resolution, we don't want it.
+
+def select_hours(outputs, horizon, resolution):
+    # Published hours that fall on the wanted resolution. Where the product is coarser than we'd like we
+    # take everything it publishes, since 3-hourly output can't be made hourly by asking.
+    return [h for h in published_hours(outputs, horizon) if spacing_at(resolution, h) is not None and h % spacing_at(resolution, h) == 0]
+
+def spacing_hours(accumulation_hours=None):
+    return [s for s in SPACING_HOURS if s <= MAX_SPACING_HOURS and (accumulation_hours is None or accumulation_hours % s == 0)]
+
+def coarsen(resolution, accumulation_hours=None):
+    # Moves the furthest segment that can still be coarsened to the next spacing, None when none can.
+    for k in reversed(range(len(resolution))):
+        until, spacing = resolution[k]
+        coarser = [s for s in spacing_hours(accumulation_hours) if s > spacing]
+        if coarser:
+            return resolution[:k] + [(until, coarser[0])] + resolution[k+1:]
+    return None
+
+def plan_forecast_hours(outputs, horizon, resolution=None, subset_bytes=None, byte_budget=None, accumulation_hours=None):
+    # The forecast hours to fetch, each once and in order. Without a resolution we take every published hour.
+    # With a byte budget (and subset_bytes, the rough size of one forecast hour's GRIB subsets) the far end
+    # is thinned out first, then nearer segments, and the horizon is only cut short as a last resort.
+    # accumulation_hours is the product's precipitation bucket, if it has one.
+    resolution = resolution or [(horizon, 1)]
+    hours = select_hours(outputs, horizon, resolution)
+    planned = resolution
+
+    if byte_budget is not None and subset_bytes is not None:
+        while len(hours) * subset_bytes > byte_budget and (coarser := coarsen(planned, accumulation_hours)) is not None:
+            planned = coarser
+            hours = select_hours(outputs, horizon, planned)
+
+        if len(hours) * subset_bytes > byte_budget:
+            hours = hours[:max(byte_budget // subset_bytes, 1)]
+
+        if planned != resolution or hours[-1] < horizon:
+            logging.info(f"Planned {len(hours)} forecast hours out to {hours[-1]} hours at {planned} "
+                         f"(~{len(hours) * subset_bytes / 2**20:.0f} MiB, budget {byte_budget / 2**20:.0f} MiB).")
+
+    # Only a resolution we were asked for can get here, coarsening never skips a bucket.
+    skipped = sorted(set(range(0, hours[-1] + 1, accumulation_hours)) - set(hours)) if accumulation_hours and hours else []
+    if skipped:
+        logging.warning(f"Forecast hours at {planned} skip the ends of {accumulation_hours}-hour precipitation buckets "
+                        f"at {skipped}, precipitation after them will be NaN.")
+
+    return hours
+
+if __name__ == "__main__":
+    from models import MODELS
+    from utils import configure_logging
+    configure_logging()
+
+    # What a week of guidance costs for every model.
+    for model, config in MODELS.items():
+        hours = plan_forecast_hours(config["outputs"], MEDIUM_RANGE_HOURS, resolution=MEDIUM_RANGE_RESOLUTION,
+                                    subset_bytes=config["subset_bytes"], byte_budget=FORECAST_BYTE_BUDGET,
+                                    accumulation_hours=config.get("accumulation_hours"))
+        print(f"{model}: {len(hours)} forecast hours out to {hours[-1]} hours, ~{len(hours) * config['subset_bytes'] / 2**20:.0f} MiB: {hours}")
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+HTTP_HEADERS = {
+    "User-Agent": "wxConch https://github.com/ali-ramadhan/wxConch",  # api.weather.gov rejects requests without one.
+    "Accept": "application/json"
+}
+
+HTTP_TIMEOUT = (5, 30)  # seconds to connect, seconds between bytes.
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 1  # seconds, doubled after every failed attempt unless the server sends Retry-After.
+HTTP_MAX_RETRY_AFTER = 60  # seconds, we'd rather fail than stall a forecast run for longer.
+HTTP_CONCURRENCY = 8
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+HTTP_CACHE_DIRECTORY = "http_cache"
+
+_session = None
+_session_lock = threading.Lock()
+
+def http_session():
+    # One session for the whole process so requests to the same API reuse keep-alive connections.
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HTTP_HEADERS)
+            adapter = HTTPAdapter(pool_connections=HTTP_CONCURRENCY, pool_maxsize=HTTP_CONCURRENCY)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def retry_after_delay(response, default):
+    # Retry-After is either a number of seconds or an HTTP date.
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is None:
+        return default
+
+    try:
+        delay = float(retry_after)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return default
+
+    return min(max(delay, 0), HTTP_MAX_RETRY_AFTER)
+
+def request(method, url, params=None, headers=None, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, **kwargs):
+    # Retries connection errors, timeouts, rate limiting and server errors. Other errors (e.g. 404) are raised right away.
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            response = http_session().request(method, url, params=params, headers=headers, timeout=timeout, **kwargs)
+            if response.status_code not in HTTP_RETRY_STATUSES:
+                response.raise_for_status()
+                return response
+            error = requests.HTTPError(f"{response.status_code} {response.reason} for {response.url}", response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+
+        if attempt == retries:
+            raise error
+
+        delay = retry_after_delay(response, backoff * 2**attempt)
+        logger.warning(f"{method} {url} failed ({error!r}). Retrying in {delay:.1f} s [{attempt+1}/{retries}]...")
+        time.sleep(delay)
+
+def get(url, params=None, headers=None, **kwargs):
+    return request("GET", url, params=params, headers=headers, **kwargs)
+
+def head(url, params=None, headers=None, **kwargs):
+    return request("HEAD", url, params=params, headers=headers, **kwargs)
+
+def get_json(url, params=None, headers=None, **kwargs):
+    return get(url, params=params, headers=headers, **kwargs).json()
+
+def http_cache_filepath(url):
+    return os.path.join(HTTP_CACHE_DIRECTORY, f"{hashlib.sha1(url.encode()).hexdigest()}.json")
+
+def get_json_conditional(url, params=None, headers=None, **kwargs):
+    # Revalidates the last response we got for url with If-None-Match/If-Modified-Since so an unchanged
+    # resource costs a 304 with no body. Returns the JSON and the response (check response.history for redirects).
+    filepath = http_cache_filepath(url)
+    cached = None
+    headers = dict(headers or {})
+
+    if os.path.exists(filepath):
+        with open(filepath) as f:
+            cached = json.load(f)
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = get(url, params=params, headers=headers, **kwargs)
+
+    if response.status_code == 304 and cached is not None:
+        logger.debug(f"{url} not modified.")
+        return cached["data"], response
+
+    data = response.json()
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+
+    if etag or last_modified:
+        os.makedirs(HTTP_CACHE_DIRECTORY, exist_ok=True)
+        with atomic_write(filepath) as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified, "data": data}, f)
+
+    return data, response
+
+def gather(function, args_list, concurrency=HTTP_CONCURRENCY, return_exceptions=False):
+    # Calls function(*args) for every args with at most `concurrency` calls in flight and returns the
+    # results in order. Failures are logged and the first exception is raised once every call has finished,
+    # or with return_exceptions=True returned in place of their results so callers can skip just those.
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(function, *args) for args in args_list]
+
+    results = [future.exception() or future.result() for future in futures]
+
+    errors = [(args, result) for args, result in zip(args_list, results) if isinstance(result, Exception)]
+    for args, e in errors:
+        logger.error(f"{function.__name__}{tuple(args)} failed: {e!r}")
+    if errors and not return_exceptions:
+        raise errors[0][1]
+
+    return results
+
+if __name__ == "__main__":
+    from utils import configure_logging
+    configure_logging()
+
+    # Testing against a local stand-in that rate limits the first request for every path.
+    import json
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    LATENCY = 0.2  # seconds
+    requests_served = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(LATENCY)
+            requests_served.append(self.path)
+
+            if requests_served.count(self.path) == 1:
+                self.send_response(429)
+                self.send_header("Retry-After", "0.1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            body = json.dumps({"path": self.path}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    n = 16
+    start = time.perf_counter()
+    results = gather(get_json, [(f"{url}/points/{k}",) for k in range(n)])
+    elapsed = time.perf_counter() - start
+
+    assert [r["path"] for r in results] == [f"/points/{k}" for k in range(n)]
+    print(f"{n} requests ({len(requests_served)} served incl. rate limited retries) in {elapsed:.2f} s, "
+          f"{n * 2 * LATENCY:.2f} s serially without retries.")
+
+    server.shutdown()
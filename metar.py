@@ -1,6 +1,47 @@
 import pandas as pd
 
-def metar_timeseries(filepath):
+# IEM ASOS/METAR CSV columns -> our variable names.
+METAR_COLUMNS = {
+    "tmpf": "temperature",
+    "sknt": "wind_speed",
+    "p01i": "precipitation"
+}
+
+# Missing observations are "M" and trace precipitation is "T". We treat both as missing.
+METAR_NA_VALUES = ["M", "T"]
+
+def parse_metar(df, columns):
+    times = pd.DatetimeIndex(pd.to_datetime(df["valid"], format="%Y-%m-%d %H:%M").values)
+    timeseries = df[list(columns)].rename(columns=columns).set_index(times)
+    return timeseries.dropna(how="all")
+
+def read_metar_csv(filepath, columns=METAR_COLUMNS, chunksize=None, extra_columns=()):
+    # Only the columns we need are parsed and they're parsed straight to floats.
+    return pd.read_csv(
+        filepath,
+        usecols=["valid", *extra_columns, *columns],
+        na_values=METAR_NA_VALUES,
+        dtype={column: "float64" for column in columns},
+        chunksize=chunksize
+    )
+
+def metar_timeseries_chunks(filepath, columns=METAR_COLUMNS, chunksize=100_000):
+    # Streams multi-year archives chunksize rows at a time.
+    for df in read_metar_csv(filepath, columns=columns, chunksize=chunksize):
+        yield parse_metar(df, columns)
+
+def metar_timeseries(filepath, columns=METAR_COLUMNS, chunksize=None):
+    if chunksize is None:
+        timeseries = parse_metar(read_metar_csv(filepath, columns=columns), columns)
+    else:
+        timeseries = pd.concat(metar_timeseries_chunks(filepath, columns=columns, chunksize=chunksize))
+
+    # IEM archives are already in time order so this is cheap, but time slicing needs it guaranteed.
+    return timeseries.sort_index(kind="stable")
+
+def metar_timeseries_rowwise(filepath):
+    # The original row-by-row loader, kept as the reference for metar_timeseries's missing ("M") and trace
+    # ("T") semantics (see benchmarks/metar_parsing.py). It's slow and reads the whole file into memory.
     df = pd.read_csv(filepath)
 
     inds_T = df["tmpf"] != "M"  # Exclude missing temperatures
@@ -15,15 +56,16 @@ def metar_timeseries(filepath):
     time_P = [pd.Timestamp(t) for t in df["valid"][inds_P]]
     precipitation = df["p01i"][inds_P].astype("float")
 
-    timeseries = pd.DataFrame({
+    return pd.DataFrame({
         "temperature": pd.Series(temperature.values, index=time_T),
         "wind_speed": pd.Series(wind_speed.values, index=time_ws),
         "precipitation": pd.Series(precipitation.values, index=time_P)
     })
 
-    return timeseries
-
 if __name__ == "__main__":
+    from utils import configure_logging
+    configure_logging()
+
     # Testing @ Boston
     timeseries = metar_timeseries("KBOS_August_2022.csv")
     print(timeseries)
@@ -0,0 +1,108 @@
+import os
+import json
+import logging
+import pandas as pd
+import xarray as xr
+
+from metar import METAR_COLUMNS, read_metar_csv, parse_metar
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# One small NetCDF file per station per month: metar_store/<station>/<YYYY-MM>.nc
+METAR_STORE_DIRECTORY = "metar_store"
+
+def metar_partition_filepath(station, month):
+    return os.path.join(METAR_STORE_DIRECTORY, station, f"{month.strftime('%Y-%m')}.nc")
+
+def manifest_filepath():
+    return os.path.join(METAR_STORE_DIRECTORY, "ingested.json")
+
+def load_manifest():
+    if not os.path.exists(manifest_filepath()):
+        return {}
+
+    with open(manifest_filepath()) as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    filepath = manifest_filepath()
+    os.makedirs(METAR_STORE_DIRECTORY, exist_ok=True)
+    with atomic_write(filepath) as f:
+        json.dump(manifest, f, indent=2)
+
+def write_metar_partition(station, month, timeseries):
+    # New observations are merged into whatever the partition already holds, newest wins.
+    filepath = metar_partition_filepath(station, month)
+
+    if os.path.exists(filepath):
+        with xr.open_dataset(filepath, engine="scipy") as ds:
+            stored = ds.to_dataframe()
+        timeseries = pd.concat([stored, timeseries])
+        timeseries = timeseries[~timeseries.index.duplicated(keep="last")]
+
+    ds = xr.Dataset.from_dataframe(timeseries.sort_index().rename_axis("time"))
+
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with atomic_write(filepath, "wb") as f:
+        ds.to_netcdf(f, engine="scipy")
+
+def ingest_metar_csv(filepath, station=None, columns=METAR_COLUMNS, chunksize=100_000, force=False):
+    # Splits an IEM METAR CSV (one or many stations) into per-station, per-month partitions.
+    # IEM uses 3-letter identifiers (e.g. FMY) so pass station to file a single-station CSV under
+    # our own identifier (e.g. KFMY). CSVs that haven't changed since they were last ingested are skipped.
+    manifest = load_manifest()
+    key = f"{os.path.abspath(filepath)}:{station}"
+    mtime = os.path.getmtime(filepath)
+
+    if not force and manifest.get(key) == mtime:
+        logging.info(f"{filepath} already ingested into {METAR_STORE_DIRECTORY}.")
+        return
+
+    n_observations = 0
+
+    for df in read_metar_csv(filepath, columns=columns, chunksize=chunksize, extra_columns=["station"]):
+        if station is not None:
+            df["station"] = station
+
+        for df_station, station_df in df.groupby("station"):
+            timeseries = parse_metar(station_df, columns)
+            n_observations += len(timeseries)
+
+            for month, month_timeseries in timeseries.groupby(timeseries.index.to_period("M")):
+                write_metar_partition(df_station, month, month_timeseries)
+
+    manifest[key] = mtime
+    save_manifest(manifest)
+
+    logging.info(f"Ingested {n_observations} observations from {filepath} into {METAR_STORE_DIRECTORY}.")
+
+def metar_query(station, start, end, variables=None):
+    # Returns observations between start and end (inclusive) for the requested variables. Only the
+    # monthly partitions overlapping [start, end] are opened and only the requested time slice and
+    # variables are read from them.
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    frames = []
+
+    for month in pd.period_range(start, end, freq="M"):
+        filepath = metar_partition_filepath(station, month)
+        if not os.path.exists(filepath):
+            continue
+
+        with xr.open_dataset(filepath, engine="scipy") as ds:
+            ds = ds[variables] if variables else ds
+            frames.append(ds.sel(time=slice(start, end)).to_dataframe())
+
+    if not frames:
+        return pd.DataFrame(columns=variables or list(METAR_COLUMNS.values()), index=pd.DatetimeIndex([]))
+
+    return pd.concat(frames).rename_axis(None)
+
+if __name__ == "__main__":
+    from utils import configure_logging
+    configure_logging()
+
+    # Testing @ Fort Myers
+    ingest_metar_csv("KFMY_2022_09.csv", station="KFMY")
+    timeseries = metar_query("KFMY", "2022-09-10 06:00", "2022-09-11 06:00")
+    print(timeseries)
@@ -1,23 +1,35 @@
-import logging.config
+import os
+import logging
 import pickle
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from matplotlib.dates import DateFormatter
-from hrrr import hrrr_forecast_time_series
-from gfs import gfs_forecast_time_series
-from nam import nam_forecast_time_series
-from ecmwf import ecmwf_forecast_time_series
-from metar import metar_timeseries
-from utils import compute_6Z_times
+from metar_store import ingest_metar_csv, metar_query
+from plotting import new_figure, save_figure, format_6Z_axis, render_plots
+from precipitation import window_precipitation_frame
+from utils import compute_6Z_times, station_time_series, atomic_write, configure_logging
+from window_statistics import window_statistics, time_series_frame, datasets_frame, window_rows
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+# Which model runs we verify, as hours before the verification date.
+# The 23Z run might not be available right at 23Z when we run WxConch so let's use 22Z model run for HRRR.
+VERIFICATION_MODEL_RUNS = {
+    "hrrr": 2,
+    "nam": 6,
+    "gfs": 6,
+    "ecmwf": 12
+}
+
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
+
 def plot_temperature_verification(timeseries, verification_date, station, filepath):
-    fig = plt.figure(figsize=(16, 9))
-    ax = plt.subplot(111)
+    fig = new_figure()
+    ax = fig.add_subplot(111)
 
     ax.plot(timeseries["metar"]["temperature"], label="METAR")
     ax.plot(timeseries["hrrr"]["temperature"], label="HRRR")
@@ -25,30 +37,20 @@ def plot_temperature_verification(timeseries, verification_date, station, filepa
     ax.plot(timeseries["gfs"]["temperature"], label="GFS")
     ax.plot(timeseries["ecmwf"]["temperature"], label="ECMWF")
 
-    # Focus on the 6Z-6Z range.
     first_6Z, second_6Z = compute_6Z_times(verification_date - pd.Timedelta(days=1))
-    plt.xlim([first_6Z - pd.Timedelta(hours=6), second_6Z + pd.Timedelta(hours=6)])
-
-    ax.axvline(x=first_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-    ax.axvline(x=second_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-
-    # Nicer date formatting.
-    formatter = DateFormatter('%m/%d %HZ')
-    ax.xaxis.set_major_formatter(formatter)
-    ax.xaxis.set_tick_params(rotation=30, labelsize=11)
+    format_6Z_axis(ax, first_6Z, second_6Z)
 
-    plt.title(f'{station} temperature verification for {verification_date.strftime("%Y/%m/%d")}')
+    ax.set_title(f'{station} temperature verification for {verification_date.strftime("%Y/%m/%d")}')
 
-    plt.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.15), frameon=False)
-    plt.xlabel("Time (UTC)")
-    plt.ylabel("Temperature (°F)")
+    ax.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.15), frameon=False)
+    ax.set_xlabel("Time (UTC)")
+    ax.set_ylabel("Temperature (°F)")
 
-    logging.info(f"Saving {filepath}...")
-    plt.savefig(filepath)
+    save_figure(fig, filepath)
 
 def plot_wind_speed_verification(timeseries, verification_date, station, filepath):
-    fig = plt.figure(figsize=(16, 9))
-    ax = plt.subplot(111)
+    fig = new_figure()
+    ax = fig.add_subplot(111)
 
     ax.plot(timeseries["metar"]["wind_speed"], label="METAR")
     ax.plot(timeseries["hrrr"]["wind_speed"], label="HRRR")
@@ -56,78 +58,46 @@ def plot_wind_speed_verification(timeseries, verification_date, station, filepat
     ax.plot(timeseries["gfs"]["wind_speed"], label="GFS")
     ax.plot(timeseries["ecmwf"]["wind_speed"], label="ECMWF")
 
-    # Focus on the 6Z-6Z range.
     first_6Z, second_6Z = compute_6Z_times(verification_date - pd.Timedelta(days=1))
-    plt.xlim([first_6Z - pd.Timedelta(hours=6), second_6Z + pd.Timedelta(hours=6)])
-
-    ax.axvline(x=first_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-    ax.axvline(x=second_6Z, ymin=0, ymax=1, color="red", linestyle="--")
-
-    # Nicer date formatting.
-    formatter = DateFormatter('%m/%d %HZ')
-    ax.xaxis.set_major_formatter(formatter)
-    ax.xaxis.set_tick_params(rotation=30, labelsize=11)
-
-    plt.title(f'{station} Wind speed verification for {verification_date.strftime("%Y/%m/%d")}')
-    plt.xlabel("Time (UTC)")
-    plt.ylabel("Wind speed (knots)")
-
-    plt.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.15), frameon=False)
+    format_6Z_axis(ax, first_6Z, second_6Z)
 
-    logging.info(f"Saving {filepath}...")
-    plt.savefig(filepath)
+    ax.set_title(f'{station} Wind speed verification for {verification_date.strftime("%Y/%m/%d")}')
+    ax.set_xlabel("Time (UTC)")
+    ax.set_ylabel("Wind speed (knots)")
 
-def min_and_max_temperature(ts):
-    t = ts.index
-    T = ts.values
+    ax.legend(loc="upper left", ncol=2, bbox_to_anchor=(0, 1.15), frameon=False)
 
-    i_min = np.argmin(T)
-    i_max = np.argmax(T)
-    t_min = t[i_min]
-    t_max = t[i_max]
-    T_min = T[i_min]
-    T_max = T[i_max]
+    save_figure(fig, filepath)
 
-    return t_min, T_min, t_max, T_max
-
-def max_wind_speed(ts):
-    t = ts.index
-    s = ts.values
-
-    i_max = np.argmax(s)
-    t_max = t[i_max]
-    s_max = s[i_max]
-
-    return t_max, s_max
-
-def compute_biases(timeseries, verification_date):
+def compute_biases(stats, verification_date):
+    # stats are one station's window statistics indexed by source (see window_statistics.window_rows).
     first_6Z, second_6Z = compute_6Z_times(verification_date - pd.Timedelta(days=1))
     logging.info(f"Computing biases for {first_6Z} to {second_6Z}...")
 
-    T_metar_6Z = timeseries["metar"]["temperature"][first_6Z:second_6Z]
-    s_metar_6Z = timeseries["metar"]["wind_speed"][first_6Z:second_6Z]
+    metar = stats.loc["metar"]
+    T_min, T_max, wind_max = metar["temperature_min"], metar["temperature_max"], metar["wind_speed_max"]
+    precipitation = metar.get("precipitation_sum", np.nan)
 
-    t_min, T_min, t_max, T_max = min_and_max_temperature(T_metar_6Z)
-    t_max_wind, wind_max = max_wind_speed(s_metar_6Z)
-
-    logging.info(f"METAR: T_min = {T_min:.1f}°F @ {t_min}, T_max = {T_max:.1f}°F @ {t_max}, wind_max = {wind_max:.1f} knots @ {t_max_wind}")
+    logging.info(f"METAR: T_min = {T_min:.1f}°F @ {metar['temperature_min_time']}, T_max = {T_max:.1f}°F @ {metar['temperature_max_time']}, "
+                 f"wind_max = {wind_max:.1f} knots @ {metar['wind_speed_max_time']}, precipitation = {precipitation:.2f} in")
 
     biases = {}
 
     for model in ("nam", "gfs", "ecmwf"):
-        T_model_6Z = timeseries[model]["temperature"][first_6Z:second_6Z]
-        s_model_6Z = timeseries[model]["wind_speed"][first_6Z:second_6Z]
-
-        t_min_model, T_min_model, t_max_model, T_max_model = min_and_max_temperature(T_model_6Z)
-        t_max_wind_model, wind_max_model = max_wind_speed(s_model_6Z)
+        forecast = stats.loc[model]
+        T_min_model, T_max_model, wind_max_model = forecast["temperature_min"], forecast["temperature_max"], forecast["wind_speed_max"]
+        precipitation_model = forecast.get("precipitation_sum", np.nan)  # NaN for models without precipitation (GFS).
 
-        logging.info(f"{model}: T_min = {T_min_model:.1f}°F @ {t_min_model}, T_max = {T_max_model:.1f}°F @ {t_max_model}, wind_max = {wind_max_model:.1f} knots @ {t_max_wind_model}")
-        logging.info(f"{model} bias: T_min = {T_min_model - T_min:.1f}°F, T_max = {T_max_model - T_max:.1f}°F, wind: {wind_max_model - wind_max:.1f} knots")
+        logging.info(f"{model}: T_min = {T_min_model:.1f}°F @ {forecast['temperature_min_time']}, T_max = {T_max_model:.1f}°F @ {forecast['temperature_max_time']}, "
+                     f"wind_max = {wind_max_model:.1f} knots @ {forecast['wind_speed_max_time']}")
+        logging.info(f"{model} bias: T_min = {T_min_model - T_min:.1f}°F, T_max = {T_max_model - T_max:.1f}°F, wind: {wind_max_model - wind_max:.1f} knots, "
+                     f"precipitation: {precipitation_model - precipitation:.2f} in")
 
         biases[model] = {
             "T_min": T_min_model - T_min,
             "T_max": T_max_model - T_max,
-            "wind_speed": wind_max_model - wind_max
+            "wind_speed": wind_max_model - wind_max,
+            "precipitation": precipitation_model - precipitation
         }
 
     return biases
@@ -136,91 +106,197 @@ def biases_dataframe(biases):
     dates = list(biases.keys())
 
     models = ("nam", "gfs", "ecmwf")
-    vars = ("T_min", "T_max", "wind_speed")
+    vars = ("T_min", "T_max", "wind_speed", "precipitation")
+
+    # Biases stored before we verified precipitation don't have it.
     biases_df = pd.DataFrame({
-        f"{model}_{var}": [biases[t][model][var] for t in dates] for model in models for var in vars
+        f"{model}_{var}": [biases[t][model].get(var, np.nan) for t in dates] for model in models for var in vars
     }, index=dates)
 
     return biases_df
 
 def plot_biases(df, station, filepath):
-    fig = plt.figure(figsize=(16, 9))
+    fig = new_figure()
 
-    ax1 = plt.subplot(311)
-    ax2 = plt.subplot(312, sharex=ax1)
-    ax3 = plt.subplot(313, sharex=ax1)
+    ax1 = fig.add_subplot(411)
+    ax2 = fig.add_subplot(412, sharex=ax1)
+    ax3 = fig.add_subplot(413, sharex=ax1)
+    ax4 = fig.add_subplot(414, sharex=ax1)
 
     models = ("nam", "gfs", "ecmwf")
     vars = ("T_min", "T_max", "wind_speed")
     colors = ("green", "red", "blue")
     markers = ("v", "^", "s")
 
-    for ax in (ax1, ax2, ax3):
+    for ax in (ax1, ax2, ax3, ax4):
         ax.axhline(y=0, color="black", linestyle="--")
 
     for m, model in enumerate(models):
             ax1.plot(df[f"{model}_T_min"], color=colors[m], marker="v", label=model)
             ax2.plot(df[f"{model}_T_max"], color=colors[m], marker="^", label=model)
             ax3.plot(df[f"{model}_wind_speed"], color=colors[m], marker="s", label=model)
+            ax4.plot(df[f"{model}_precipitation"], color=colors[m], marker="o", label=model)
 
     ax1.set_ylabel("T_min bias (°F)")
     ax2.set_ylabel("T_max bias (°F)")
     ax3.set_ylabel("wind speed bias (knots)")
-    ax3.set_xlabel("Time (UTC)")
+    ax4.set_ylabel("precipitation bias (in)")
+    ax4.set_xlabel("Time (UTC)")
 
-    plt.setp(ax1.get_xticklabels(), visible=False)
-    plt.setp(ax2.get_xticklabels(), visible=False)
+    ax1.tick_params(labelbottom=False)
+    ax2.tick_params(labelbottom=False)
+    ax3.tick_params(labelbottom=False)
 
     ax1.set_title(f"Bias verification for {station}")
     ax1.legend(loc="upper left", ncol=3, bbox_to_anchor=(0, 1.2), frameon=False)
 
-    logging.info(f"Saving {filepath}...")
-    plt.savefig(filepath)
+    save_figure(fig, filepath)
 
-def compute_model_biases(lat, lon, station, metar_filepath, verification_dates):
-    storage = {}
-    biases = {}
+def load_pickle(filepath, default):
+    if not os.path.exists(filepath):
+        return default
 
-    for verification_date in verification_dates:
-        # 23Z run might not be available right at 23Z when we run WxConch so let's use 22Z model run for HRRR.
-        hrrr_model_time = (verification_date - pd.Timedelta(hours=2)).strftime("%Y-%m-%d %H:%M")
-        nam_model_time = (verification_date - pd.Timedelta(hours=6)).strftime("%Y-%m-%d %H:%M")
-        gfs_model_time = (verification_date - pd.Timedelta(hours=6)).strftime("%Y-%m-%d %H:%M")
-        ecmwf_model_time = (verification_date - pd.Timedelta(hours=12)).strftime("%Y-%m-%d %H:%M")
-
-        timeseries = {
-            "metar": metar_timeseries(metar_filepath),
-            "hrrr": hrrr_forecast_time_series(hrrr_model_time, lat, lon),
-            "nam": nam_forecast_time_series(nam_model_time, lat, lon),
-            "gfs": gfs_forecast_time_series(gfs_model_time, lat, lon),
-            "ecmwf": ecmwf_forecast_time_series(ecmwf_model_time, lat, lon)
-        }
+    with open(filepath, "rb") as handle:
+        return pickle.load(handle)
+
+def save_pickle(obj, filepath):
+    # Write to a temporary file first so an interrupted run never leaves a corrupt store behind.
+    with atomic_write(filepath, "wb") as handle:
+        pickle.dump(obj, handle)
+
+def bias_store_filepath(station):
+    return f"bias_store_{station}.pickle"
+
+def storage_filepath(station):
+    return f"storage_{station}.pickle"
+
+def verify_date(stations, metar, verification_date, plot_executor="serial"):
+    # metar maps each station to its observations around the verification date.
+    # The model pipeline (and Herbie/ecCodes with it) is only loaded once there's a date left to verify.
+    from models import model_forecast_stations_dataset
+
+    datasets = {}
+    for model, hours_before in VERIFICATION_MODEL_RUNS.items():
+        model_time = (verification_date - pd.Timedelta(hours=hours_before)).strftime("%Y-%m-%d %H:%M")
+        datasets[model] = model_forecast_stations_dataset(model, model_time, stations)
 
-        storage[verification_date] = timeseries
+    # Window statistics for every source and station in one go.
+    first_6Z, _ = compute_6Z_times(verification_date - pd.Timedelta(days=1))
+    frame = pd.concat([
+        time_series_frame({("metar", station): window_precipitation_frame(metar[station]) for station, _, _ in stations}),
+        datasets_frame(datasets)
+    ], ignore_index=True)
+    stats = window_statistics(frame)
 
-        logging.info(f"Computing biases for {verification_date}...")
-        biases[verification_date] = compute_biases(timeseries, verification_date)
+    results = {}
+    plots = []
+
+    for station, _, _ in stations:
+        timeseries = {"metar": metar[station]}
+        timeseries.update({model: station_time_series(ds, station) for model, ds in datasets.items()})
+
+        logging.info(f"Computing {station} biases for {verification_date}...")
+        biases = compute_biases(window_rows(stats, station, first_6Z), verification_date)
 
         temperature_filepath = f'temperature_verification_{station}_{verification_date.strftime("%Y-%m-%d")}.png'
         wind_speed_filepath = f'wind_speed_verification_{station}_{verification_date.strftime("%Y-%m-%d")}.png'
 
-        plot_temperature_verification(timeseries, verification_date, station, temperature_filepath)
-        plot_wind_speed_verification(timeseries, verification_date, station, wind_speed_filepath)
+        plots += [
+            (plot_temperature_verification, (timeseries, verification_date, station, temperature_filepath)),
+            (plot_wind_speed_verification, (timeseries, verification_date, station, wind_speed_filepath))
+        ]
+
+        results[station] = (timeseries, biases)
+
+    render_plots(plots, executor=plot_executor)
 
+    return results
 
-    with open(f"storage_{station}.pickle", "wb") as handle:
-        pickle.dump(storage, handle)
+def metar_window(station, verification_date):
+    # Just enough observations to verify and plot the 6Z-6Z window. Only the monthly partitions of the
+    # METAR store covering it are read, so workers don't get sent whole archives.
+    return metar_query(station, verification_date - pd.Timedelta(hours=6), verification_date + pd.Timedelta(days=1, hours=18))
 
-    biases_df = biases_dataframe(biases)
-    start_date = verification_dates[0].strftime("%Y-%m-%d")
-    end_date = verification_dates[-1].strftime("%Y-%m-%d")
-    biases_filepath = f"bias_verification_{station}_{start_date}_{end_date}.png"
-    plot_biases(biases_df, station, biases_filepath)
+def compute_stations_model_biases(stations, metar_filepaths, verification_dates, incremental=True, executor="serial", max_workers=None, plot_executor="serial"):
+    # stations is a list of (station, lat, lon) tuples and metar_filepaths maps each station to its METAR CSV.
+    # Every model run is downloaded and decoded once per verification date for all stations.
+    # Biases are kept in a persistent per-station store. In incremental mode only dates that aren't in the
+    # store yet are verified, so extending the verification window costs only the new dates. Otherwise the
+    # requested dates are verified again and replace their stored results; other dates are always kept.
+    # Verification dates are independent so they can be fanned out to a process pool. A failing date is
+    # logged and reported in `failures` without affecting the other dates.
+    for station, _, _ in stations:
+        ingest_metar_csv(metar_filepaths[station], station=station)
 
-    with open(f"biases_{station}.pickle", "wb") as handle:
-        pickle.dump(biases_df, handle)
+    storage = {station: load_pickle(storage_filepath(station), {}) for station, _, _ in stations}
+    biases = {station: load_pickle(bias_store_filepath(station), {}) for station, _, _ in stations}
+
+    jobs = {}
+    for verification_date in verification_dates:
+        pending = [(station, lat, lon) for station, lat, lon in stations if not incremental or verification_date not in biases[station]]
+
+        if pending:
+            jobs[verification_date] = (pending, {station: metar_window(station, verification_date) for station, _, _ in pending})
+        else:
+            logging.info(f"Biases for {verification_date} already stored for all stations.")
+
+    failures = {}
+
+    def store(verification_date, results):
+        # The storage is saved before the bias store so an interrupted run never leaves a date marked as
+        # verified without its time series.
+        for station, (timeseries, station_biases) in results.items():
+            storage[station][verification_date] = timeseries
+            biases[station][verification_date] = station_biases
+            save_pickle(storage[station], storage_filepath(station))
+            save_pickle(biases[station], bias_store_filepath(station))
+
+    if executor == "serial":
+        for verification_date, (pending, metar_windows) in jobs.items():
+            try:
+                store(verification_date, verify_date(pending, metar_windows, verification_date, plot_executor=plot_executor))
+            except Exception as e:
+                logging.error(f"Failed to verify {verification_date}: {e!r}")
+                failures[verification_date] = e
+    else:
+        max_workers = max_workers or os.cpu_count()
+        logging.info(f"Verifying {len(jobs)} dates ({executor} pool, max_workers={max_workers})...")
+
+        with EXECUTORS[executor](max_workers=max_workers) as pool:
+            futures = {pool.submit(verify_date, pending, metar_windows, verification_date): verification_date
+                       for verification_date, (pending, metar_windows) in jobs.items()}
+
+            for future in as_completed(futures):
+                verification_date = futures[future]
+                try:
+                    store(verification_date, future.result())
+                    logging.info(f"Verified {verification_date}.")
+                except Exception as e:
+                    logging.error(f"Failed to verify {verification_date}: {e!r}")
+                    failures[verification_date] = e
+
+    plots = []
+
+    for station, _, _ in stations:
+        biases_df = biases_dataframe({date: biases[station][date] for date in verification_dates if date in biases[station]})
+        start_date = verification_dates[0].strftime("%Y-%m-%d")
+        end_date = verification_dates[-1].strftime("%Y-%m-%d")
+        biases_filepath = f"bias_verification_{station}_{start_date}_{end_date}.png"
+        plots.append((plot_biases, (biases_df, station, biases_filepath)))
+
+        save_pickle(biases_df, f"biases_{station}.pickle")
+
+    render_plots(plots, executor=plot_executor)
+
+    return failures
+
+def compute_model_biases(lat, lon, station, metar_filepath, verification_dates, incremental=True, executor="serial", max_workers=None, plot_executor="serial"):
+    return compute_stations_model_biases([(station, lat, lon)], {station: metar_filepath}, verification_dates, incremental=incremental,
+                                         executor=executor, max_workers=max_workers, plot_executor=plot_executor)
 
 if __name__ == "__main__":
+    configure_logging()
+
     # Testing @ Boston
     # lat, lon = 42.362389, 288.908917
     # station = "KBOS"
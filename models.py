@@ -0,0 +1,199 @@
+import logging
+import numbers
+import xarray as xr
+
+from points import forecast_stations_values, iter_forecast_stations_values, POINT_INTERPOLATION
+from precipitation import mm2inches, deaccumulate_dataset
+from run_availability import latest_complete_run
+from horizons import plan_forecast_hours, MEDIUM_RANGE_HOURS, MEDIUM_RANGE_RESOLUTION, FORECAST_BYTE_BUDGET
+from utils import K2F, uv2knots, station_time_series, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Every NWP model we pull point forecasts from is described here and goes through the same pipeline
+# (concurrent byte-range downloads, cached station -> grid point lookup, point cache), so adding a model
+# is just another entry:
+#   model, product:  Herbie model and product.
+#   index_url:       where the GRIB index for a run (date) and forecast hour (fxx) is published, used to find the latest complete run.
+#   fields:          GRIB search strings to download. Some products pack u and v into one message (NAM).
+#   cadence_hours:   how often the model runs, and latest_runs how many runs back to look for a complete one.
+#   forecast_hours:  how far out we forecast by default.
+#   outputs:         which forecast hours the product publishes, as (up to hour, every n hours) segments.
+#   subset_bytes:    roughly how many bytes one forecast hour of `fields` is, for budgeting longer horizons.
+#   accumulation_hours: how often precipitation buckets start over, for products that don't accumulate since the run start.
+#   variables:       which of VARIABLES the model provides.
+#   members:         ensemble members (Herbie's member argument), only for ensembles.
+MODELS = {
+    "hrrr": {
+        "model": "hrrr",
+        "index_url": "https://noaa-hrrr-bdp-pds.s3.amazonaws.com/hrrr.{date:%Y%m%d}/conus/hrrr.t{date:%H}z.wrfsfcf{fxx:02d}.grib2.idx",
+        "product": "sfc",
+        "fields": [":TMP:2 m", ":UGRD:10 m", ":VGRD:10 m", ":APCP:"],
+        "cadence_hours": 1,
+        "latest_runs": 6,
+        "forecast_hours": 18,
+        "outputs": [(48, 1)],  # Only the 00/06/12/18Z runs go past 18 hours.
+        "subset_bytes": 6 * 2**20,
+        "variables": ["temperature", "wind_speed", "precipitation"]
+    },
+    "rap": {
+        "model": "rap",
+        "index_url": "https://noaa-rap-pds.s3.amazonaws.com/rap.{date:%Y%m%d}/rap.t{date:%H}z.awp130pgrbf{fxx:02d}.grib2.idx",
+        "product": "awp130pgrb",  # 13 km CONUS
+        "fields": [":TMP:2 m", ":UGRD:10 m", ":VGRD:10 m", ":APCP:"],
+        "cadence_hours": 1,
+        "latest_runs": 6,
+        "forecast_hours": 21,
+        "outputs": [(51, 1)],  # Only the 03/09/15/21Z runs go past 21 hours.
+        "subset_bytes": 1 * 2**20,
+        "variables": ["temperature", "wind_speed", "precipitation"]
+    },
+    "nam": {
+        "model": "nam",
+        "index_url": "https://noaa-nam-pds.s3.amazonaws.com/nam.{date:%Y%m%d}/nam.t{date:%H}z.conusnest.hiresf{fxx:02d}.tm00.grib2.idx",
+        "product": "conusnest.hiresf",
+        "fields": [":TMP:2 m", ":VGRD:10 m", ":APCP:"],
+        "cadence_hours": 6,
+        "latest_runs": 4,
+        "forecast_hours": 48,  # NAM 5km goes up to 60 hours but we only need 48 hours max to cover the WxChallenge forecast period.
+        "outputs": [(60, 1)],
+        "subset_bytes": 5 * 2**20,
+        "accumulation_hours": 3,  # "0-1", "0-2", "0-3", "3-4", ...
+        "variables": ["temperature", "wind_speed", "precipitation"]
+    },
+    "gfs": {
+        "model": "gfs",
+        "index_url": "https://noaa-gfs-bdp-pds.s3.amazonaws.com/gfs.{date:%Y%m%d}/{date:%H}/atmos/gfs.t{date:%H}z.pgrb2.0p25.f{fxx:03d}.idx",
+        "product": "pgrb2.0p25",
+        "fields": [":TMP:2 m", ":UGRD:10 m", ":VGRD:10 m"],
+        "cadence_hours": 6,
+        "latest_runs": 6,
+        "forecast_hours": 48,
+        "outputs": [(120, 1), (384, 3)],
+        "subset_bytes": 2 * 2**20,
+        "variables": ["temperature", "wind_speed"]
+    },
+    "ecmwf": {
+        "model": "ecmwf",
+        "index_url": "https://ecmwf-forecasts.s3.eu-central-1.amazonaws.com/{date:%Y%m%d}/{date:%H}z/ifs/0p25/oper/{date:%Y%m%d%H}0000-{fxx}h-oper-fc.index",
+        "product": "oper",
+        "fields": [":2t:", ":10u:", ":10v:", ":tp:"],
+        "cadence_hours": 12,
+        "latest_runs": 6,
+        "forecast_hours": 60,
+        "outputs": [(144, 3), (240, 6)],
+        "subset_bytes": 3 * 2**20,
+        "variables": ["temperature", "wind_speed", "precipitation"]
+    },
+    "gefs": {
+        "model": "gefs",
+        "index_url": "https://noaa-gefs-pds.s3.amazonaws.com/gefs.{date:%Y%m%d}/{date:%H}/atmos/pgrb2ap5/gec00.t{date:%H}z.pgrb2a.0p50.f{fxx:03d}.idx",
+        "product": "atmos.5",  # 0.5 degree
+        "fields": [":TMP:2 m", ":UGRD:10 m", ":VGRD:10 m", ":APCP:"],
+        "cadence_hours": 6,
+        "latest_runs": 4,
+        "forecast_hours": 48,
+        "outputs": [(240, 3), (384, 6)],
+        "subset_bytes": 1 * 2**20,
+        "accumulation_hours": 6,  # "0-3", "0-6", "6-9", ...
+        "variables": ["temperature", "wind_speed", "precipitation"],
+        "members": ["c00"] + [f"p{m:02d}" for m in range(1, 31)]
+    }
+}
+
+# Our variables as (conversion, GRIB variables) with the GRIB variables named as in points.GRIB_VARIABLES.
+# Precipitation comes out of points in millimeters whatever the model's units.
+VARIABLES = {
+    "temperature": (K2F, ["t2m"]),
+    "wind_speed": (uv2knots, ["u10", "v10"]),
+    "precipitation": (mm2inches, ["tp"])
+}
+
+def forecast_hours(model, hours=None, resolution=None, byte_budget=None):
+    # hours is how far out to go (the model's forecast_hours by default) or the forecast hours themselves.
+    # resolution and byte_budget go to horizons.plan_forecast_hours, e.g. for a week of 3/6-hourly guidance.
+    config = MODELS[model]
+    hours = config["forecast_hours"] if hours is None else hours
+
+    # numbers.Integral so numpy integers are horizons too.
+    if not isinstance(hours, numbers.Integral):
+        return sorted({int(h) for h in hours})
+
+    return plan_forecast_hours(config["outputs"], int(hours), resolution=resolution, subset_bytes=config["subset_bytes"], byte_budget=byte_budget,
+                               accumulation_hours=config.get("accumulation_hours"))
+
+def model_products(model, forecast_time, hours=None, member=None):
+    from herbie import Herbie
+
+    config = MODELS[model]
+    members = {} if member is None else {"member": member}
+    return [Herbie(forecast_time, model=config["model"], product=config["product"], fxx=h, **members) for h in forecast_hours(model, hours)]
+
+def model_variables(model, point):
+    # point holds GRIB variables (a whole run or a single hour), returns our variables. Neighbourhood
+    # extraction also gives e.g. t2m_min and t2m_max which become temperature_min and temperature_max.
+    variables = {}
+    for variable in MODELS[model]["variables"]:
+        convert, grib_variables = VARIABLES[variable]
+
+        # A single forecast hour can be missing a variable, e.g. there's no precipitation at the analysis.
+        if not all(v in point for v in grib_variables):
+            continue
+
+        variables[variable] = convert(*[point[v] for v in grib_variables])
+
+        if len(grib_variables) == 1:
+            for stat in ("min", "max"):
+                if f"{grib_variables[0]}_{stat}" in point:
+                    variables[f"{variable}_{stat}"] = convert(point[f"{grib_variables[0]}_{stat}"])
+
+            # Accumulation windows, until precipitation.deaccumulate_dataset is done with them.
+            if f"{grib_variables[0]}_hours" in point:
+                variables[f"{variable}_hours"] = point[f"{grib_variables[0]}_hours"]
+
+    return xr.Dataset(variables)
+
+def model_forecast_stations_dataset(model, forecast_time, stations, hours=None, fields=None, use_cache=True, method=POINT_INTERPOLATION):
+    products = model_products(model, forecast_time, hours=hours)
+    point = forecast_stations_values(products, fields or MODELS[model]["fields"], stations, use_cache=use_cache, method=method)
+    return deaccumulate_dataset(model_variables(model, point), forecast_time)
+
+def iter_model_forecast_stations(model, forecast_time, stations, hours=None, fields=None, use_cache=True, method=POINT_INTERPOLATION, member=None):
+    # Streaming version of model_forecast_stations_dataset: yields a (station,) dataset per forecast hour,
+    # with a scalar time coordinate, as soon as that hour is available. Hours arrive out of order so
+    # precipitation is still accumulated, with its window in precipitation_hours.
+    products = model_products(model, forecast_time, hours=hours, member=member)
+    names = [station for station, _, _ in stations]
+
+    for time, values in iter_forecast_stations_values(products, fields or MODELS[model]["fields"], stations, use_cache=use_cache, method=method):
+        point = xr.Dataset({name: ("station", v) for name, v in values.items()}, coords={"time": time, "station": names})
+        yield model_variables(model, point)
+
+def model_forecast_time_series(model, forecast_time, target_lat, target_lon, hours=None, fields=None, use_cache=True, method=POINT_INTERPOLATION):
+    ds = model_forecast_stations_dataset(model, forecast_time, [("target", target_lat, target_lon)], hours=hours, fields=fields, use_cache=use_cache, method=method)
+    return station_time_series(ds, "target")
+
+def latest_model_forecast_time(model, hours=None):
+    # The latest run that's published out to the last of `hours` (see forecast_hours).
+    config = MODELS[model]
+    return latest_complete_run(config["index_url"], config["cadence_hours"], max(forecast_hours(model, hours)), n=config["latest_runs"])
+
+def latest_model_forecast_stations_dataset(model, stations, method=POINT_INTERPOLATION):
+    return model_forecast_stations_dataset(model, latest_model_forecast_time(model), stations, method=method)
+
+def medium_range_model_forecast_stations_dataset(model, stations, hours=MEDIUM_RANGE_HOURS, resolution=MEDIUM_RANGE_RESOLUTION, byte_budget=FORECAST_BYTE_BUDGET, method=POINT_INTERPOLATION):
+    # A week of guidance, hourly near-term and coarser later, for a bounded number of bytes per run.
+    planned = forecast_hours(model, hours, resolution=resolution, byte_budget=byte_budget)
+    return model_forecast_stations_dataset(model, latest_model_forecast_time(model, planned), stations, hours=planned, method=method)
+
+def latest_model_forecast_time_series(model, lat, lon, method=POINT_INTERPOLATION):
+    ds = latest_model_forecast_stations_dataset(model, [("target", lat, lon)], method=method)
+    return station_time_series(ds, "target")
+
+if __name__ == "__main__":
+    configure_logging()
+
+    # Testing @ Boston
+    lat_Boston, lon_Boston = 42.362389, 288.908917
+    timeseries = latest_model_forecast_time_series("rap", lat_Boston, lon_Boston)
+    print(timeseries)
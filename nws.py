@@ -1,53 +1,174 @@
+import os
 import json
+import time
+import logging
+import threading
 import requests
-import logging.config
+import numpy as np
 import pandas as pd
-from utils import longitude_east_to_west
+from http_client import get_json, get_json_conditional, gather, HTTP_CONCURRENCY
+from utils import longitude_east_to_west, atomic_write, configure_logging
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 MILES_PER_HOUR_TO_KNOTS = 0.868976  # See https://en.wikipedia.org/wiki/Knot_(unit)#Definitions
 
-def nws_forecast_time_series(lat, lon):
-    lon = longitude_east_to_west(lon)
+# Which forecast office and grid cell a point belongs to essentially never changes, so we only ask
+# api.weather.gov/points once a month per station.
+NWS_POINTS_FILEPATH = "nws_points.json"
+NWS_POINTS_TTL = 30 * 86400  # seconds
+
+_nws_points_lock = threading.Lock()
+
+# Wind speeds and gusts come as "10 mph" or as a range "10 to 15 mph".
+NWS_WIND_SPEED_REGEX = r"(?P<low>\d+(?:\.\d+)?)(?:\s*to\s*(?P<high>\d+(?:\.\d+)?))?"
+
+def load_nws_points():
+    if not os.path.exists(NWS_POINTS_FILEPATH):
+        return {}
+
+    with open(NWS_POINTS_FILEPATH) as f:
+        return json.load(f)
+
+def store_nws_point(key, point):
+    # point=None invalidates the cached entry.
+    with _nws_points_lock:
+        points = load_nws_points()
+
+        if point is None:
+            points.pop(key, None)
+        else:
+            points[key] = point
+
+        with atomic_write(NWS_POINTS_FILEPATH) as f:
+            json.dump(points, f, indent=2)
+
+def nws_point(lat, lon, use_cache=True):
+    # Resolves a point to its forecast office, grid cell and forecast URLs. The API works at 4 decimal places.
+    key = f"{lat:.4f},{lon:.4f}"
+
+    if use_cache:
+        with _nws_points_lock:
+            point = load_nws_points().get(key)
+        if point is not None and time.time() - point["resolved"] < NWS_POINTS_TTL:
+            return key, point
+
+    properties = get_json(f"https://api.weather.gov/points/{key}")["properties"]
+    point = {name: properties[name] for name in ("cwa", "gridX", "gridY", "forecast", "forecastHourly")}
+    point["resolved"] = time.time()
+
+    store_nws_point(key, point)
+    return key, point
+
+def nws_hourly_forecast(lat, lon, use_cache=True):
+    key, point = nws_point(lat, lon, use_cache=use_cache)
+
+    logger.info(f"National Weather Service: WFO={point['cwa']}, (X,Y)=({point['gridX']},{point['gridY']})")
+    logger.info(f"Forecast URL: {point['forecast']}")
+    logger.info(f"Hourly forecast URL: {point['forecastHourly']}")
 
-    api_url = f"https://api.weather.gov/points/{lat},{lon}"
-    response = requests.get(api_url)
+    try:
+        hourly_forecast, response = get_json_conditional(point["forecastHourly"])
+    except requests.HTTPError as e:
+        # The grid behind a cached point can change (e.g. a forecast office boundary moving). Re-resolve once.
+        if use_cache and e.response is not None and e.response.status_code == 404:
+            logger.warning(f"{point['forecastHourly']} not found, resolving {key} again...")
+            store_nws_point(key, None)
+            return nws_hourly_forecast(lat, lon, use_cache=False)
+        raise
 
-    if response.status_code != 200:
-        response.raise_for_status()
+    if any(r.status_code in (301, 308) for r in response.history):
+        logger.info(f"{point['forecastHourly']} moved to {response.url}, resolving {key} again next time.")
+        store_nws_point(key, None)
 
-    point = json.loads(response.content)
+    return hourly_forecast
 
-    wfo = point["properties"]["cwa"]
-    X = point["properties"]["gridX"]
-    Y = point["properties"]["gridY"]
-    forecast_url = point["properties"]["forecast"]
-    hourly_forecast_url = point["properties"]["forecastHourly"]
+def iso8601_to_utc(timestamps):
+    # NWS timestamps are fixed width with a UTC offset, e.g. "2022-11-06T01:00:00-05:00", or "Z" for UTC. numpy
+    # parses the local times of the whole column at once (pandas is slow with offsets) and the offsets, which
+    # differ across a DST change, are read off the characters of every timestamp at once. Anything else (e.g.
+    # fractional seconds) goes through pandas one by one and comes out as NaT if even pandas can't parse it.
+    timestamps = np.asarray(timestamps, dtype=str)
+    lengths = np.char.str_len(timestamps)
+    chars = timestamps.astype("U25").view("U1").reshape(len(timestamps), 25)
+    digits = chars[:, [20, 21, 23, 24]].view(np.uint32).astype(np.int64) - ord("0")
 
-    logger.info(f"National Weather Service: WFO={wfo}, (X,Y)=({X},{Y})")
-    logger.info(f"Forecast URL: {forecast_url}")
-    logger.info(f"Hourly forecast URL: {hourly_forecast_url}")
+    utc = (lengths == 20) & (chars[:, 19] == "Z")
+    offset = (lengths == 25) & np.isin(chars[:, 19], ["+", "-"]) & (chars[:, 22] == ":") & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    fast = utc | offset
 
-    response = requests.get(hourly_forecast_url)
-    hourly_forecast = json.loads(response.content)
+    try:
+        local = timestamps[fast].astype("U19").astype("datetime64[s]")
+    except ValueError:
+        # The right shape but not a date (e.g. month 13), which pandas turns into NaT.
+        local = pd.to_datetime(timestamps[fast].astype("U19"), format="%Y-%m-%dT%H:%M:%S", errors="coerce").values
 
-    periods = hourly_forecast["properties"]["periods"]
-    n_periods = len(periods)
+    sign = np.where(chars[fast, 19] == "-", -1, 1)
+    minutes = np.where(offset[fast], sign * (60 * (10 * digits[fast, 0] + digits[fast, 1]) + 10 * digits[fast, 2] + digits[fast, 3]), 0)
 
-    times = [pd.Timestamp(periods[p]["startTime"]).tz_convert("UTC").tz_localize(None) for p in range(n_periods)]
-    temperature = [periods[p]["temperature"] for p in range(n_periods)]
-    wind_speed = [MILES_PER_HOUR_TO_KNOTS * float(periods[p]["windSpeed"].split()[0]) for p in range(n_periods)]
+    times = np.full(len(timestamps), np.datetime64("NaT"), dtype="datetime64[ns]")
+    times[fast] = local - minutes.astype("timedelta64[m]")
+
+    if not fast.all():
+        odd = [pd.to_datetime(t, utc=True, errors="coerce") for t in timestamps[~fast]]
+        logger.warning(f"Parsing {len(odd)} NWS timestamps in unexpected formats, e.g. {str(timestamps[~fast][0])!r}.")
+        times[~fast] = pd.DatetimeIndex(odd, tz="UTC").tz_convert(None).values
+
+    return pd.DatetimeIndex(times)
+
+def parse_wind_speeds(speeds):
+    # Parses e.g. "10 mph" or "10 to 15 mph" (or None) into (low, high) wind speeds in knots. high = low without a range.
+    speeds = pd.Series(speeds, dtype="object").str.extract(NWS_WIND_SPEED_REGEX).astype("float64").values
+    low, high = speeds[:, 0], speeds[:, 1]
+    return MILES_PER_HOUR_TO_KNOTS * low, MILES_PER_HOUR_TO_KNOTS * np.where(np.isnan(high), low, high)
+
+def parse_nws_periods(periods):
+    # Only the fields we use are pulled out of the periods, and each is then converted as a whole column.
+    # Gusts are only given when they're expected and not at all by some offices.
+    n = len(periods)
+    times = iso8601_to_utc([period["startTime"] for period in periods])
+
+    # Sustained winds and gusts go through the regex together.
+    speeds = [period["windSpeed"] for period in periods] + [period.get("windGust") for period in periods]
+    low, high = parse_wind_speeds(speeds)
 
     timeseries = pd.DataFrame({
-        "temperature": temperature,
-        "wind_speed": wind_speed,
+        "temperature": np.array([period["temperature"] for period in periods], dtype="float64"),
+        "wind_speed": low[:n],
+        "wind_speed_max": high[:n],
+        "wind_gust": low[n:],
+        "precipitation_probability": np.array([(period.get("probabilityOfPrecipitation") or {}).get("value") for period in periods], dtype="float64")
     }, index=times)
 
-    return timeseries
+    # A period whose start time can't be parsed at all is dropped rather than failing the whole forecast.
+    return timeseries[timeseries.index.notna()]
+
+def nws_forecast_time_series(lat, lon, use_cache=True):
+    lon = longitude_east_to_west(lon)
+    hourly_forecast = nws_hourly_forecast(lat, lon, use_cache=use_cache)
+
+    return parse_nws_periods(hourly_forecast["properties"]["periods"])
+
+def nws_forecast_stations_dataset(stations, concurrency=HTTP_CONCURRENCY):
+    # The NWS API serves one point per request so we query the stations concurrently. A station whose
+    # gridpoint fails (e.g. a 500 after retries) is left as NaN without taking down the other stations.
+    import xarray as xr
+
+    names = [station for station, _, _ in stations]
+    results = gather(nws_forecast_time_series, [(lat, lon) for _, lat, lon in stations], concurrency=concurrency, return_exceptions=True)
+    timeseries = {station: ts for station, ts in zip(names, results) if not isinstance(ts, Exception)}
+
+    if not timeseries:
+        raise RuntimeError(f"Failed to fetch the NWS forecast for all {len(stations)} stations.")
+    if len(timeseries) < len(stations):
+        logging.warning(f"Skipping NWS forecasts for {', '.join(station for station in names if station not in timeseries)}.")
+
+    ds = xr.concat([ts.rename_axis("time").to_xarray() for ts in timeseries.values()], dim=pd.Index(list(timeseries), name="station"))
+    return ds.reindex(station=names).transpose("time", "station")
 
 if __name__ == "__main__":
+    configure_logging()
+
     # Testing @ Boston
     lat_Boston, lon_Boston = 42.362389, 288.908917
     timeseries = nws_forecast_time_series(lat_Boston, lon_Boston)
@@ -1,9 +1,7 @@
-import json
-import requests
-import logging.config
+import logging
 from datetime import datetime
+from http_client import get_json, gather, HTTP_CONCURRENCY
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 # Request headers
@@ -23,12 +21,7 @@ def open_weather_map_temp_time_series(city_id):
         'units': "imperial"
     }
 
-    response = requests.get(OWM_FORECAST_URL, params=req_params)
-
-    if response.status_code != 200:
-        response.raise_for_status()
-
-    forecast = json.loads(response.content)
+    forecast = get_json(OWM_FORECAST_URL, params=req_params, headers=OWM_HEADERS)
 
     city_id = forecast['city']['id']
     city_name = forecast['city']['name']
@@ -54,3 +47,7 @@ def open_weather_map_temp_time_series(city_id):
         logger.debug("{:s} T={:.1f}°F, T_min={:.1f}°F, T_max={:.1f}°F".format(t_txt, T, T_min, T_max))
 
     return times, temps
+
+def open_weather_map_temp_time_series_batch(city_ids, concurrency=HTTP_CONCURRENCY):
+    # Queries the cities concurrently.
+    return gather(open_weather_map_temp_time_series, [(city_id,) for city_id in city_ids], concurrency=concurrency)
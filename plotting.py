@@ -0,0 +1,91 @@
+import os
+import threading
+import logging
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+FIGURE_SIZE = (16, 9)
+
+# Matplotlib's Agg rendering holds the GIL for most of a plot so processes scale better, but threads
+# work too since every thread gets its own figure.
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
+
+# Figures are built with the object-oriented API on an Agg canvas so they never touch pyplot's global
+# figure registry. Each thread (and so each worker process) keeps one figure around and clears it for the next plot.
+_figures = threading.local()
+
+def new_figure():
+    fig = getattr(_figures, "figure", None)
+
+    if fig is None:
+        # Matplotlib is only loaded once we actually plot something.
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = _figures.figure = Figure(figsize=FIGURE_SIZE)
+        FigureCanvasAgg(fig)
+    else:
+        fig.clear()
+        fig.set_size_inches(FIGURE_SIZE)
+
+    return fig
+
+def save_figure(fig, filepath):
+    logging.info(f"Saving {filepath}...")
+    fig.savefig(filepath)
+    fig.clear()  # Don't hold on to the plotted data until the next plot.
+
+def format_6Z_axis(ax, first_6Z, second_6Z):
+    from matplotlib.dates import DateFormatter
+
+    ax.axvline(x=first_6Z, ymin=0, ymax=1, color="red", linestyle="--")
+    ax.axvline(x=second_6Z, ymin=0, ymax=1, color="red", linestyle="--")
+
+    # Focus on the 6Z-6Z range.
+    ax.set_xlim([first_6Z - pd.Timedelta(hours=6), second_6Z + pd.Timedelta(hours=6)])
+
+    # Nicer date formatting.
+    formatter = DateFormatter('%m/%d %HZ')
+    ax.xaxis.set_major_formatter(formatter)
+    ax.xaxis.set_tick_params(rotation=30, labelsize=11)
+
+def render_plots(jobs, executor="serial", max_workers=None):
+    # Each job is a (plot_function, args) tuple with the output filepath as the last argument. Plot functions
+    # must be module-level functions so they can be sent to worker processes. A failing plot is logged and
+    # reported in `failures`.
+    if executor != "serial" and executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}. Choose from serial, {', '.join(EXECUTORS)}.")
+
+    failures = {}
+
+    if executor == "serial":
+        for n, (plot, args) in enumerate(jobs):
+            try:
+                plot(*args)
+            except Exception as e:
+                logging.error(f"Failed to render {args[-1]}: {e!r}")
+                failures[n] = e
+        return failures
+
+    max_workers = max_workers or os.cpu_count()
+    logging.info(f"Rendering {len(jobs)} plots ({executor} pool, max_workers={max_workers})...")
+
+    with EXECUTORS[executor](max_workers=max_workers) as pool:
+        futures = {pool.submit(plot, *args): n for n, (plot, args) in enumerate(jobs)}
+
+        for future in as_completed(futures):
+            n = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                plot, args = jobs[n]
+                logging.error(f"Failed to render {args[-1]}: {e!r}")
+                failures[n] = e
+
+    return failures
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+POINT_CACHE_DIRECTORY = "point_cache"
+POINT_CACHE_MAX_BYTES = 2**30  # 1 GiB
+
+# Bumped whenever what we store changes. 2: accumulations come with their window and in millimeters.
+POINT_CACHE_VERSION = 2
+
+_grids_lock = threading.Lock()
+
+def product_key(product, field):
+    key = (POINT_CACHE_VERSION, product.model, product.product, pd.Timestamp(product.date).strftime("%Y-%m-%d %H:%M"), int(product.fxx), field)
+
+    # Ensemble members share everything else.
+    member = getattr(product, "member", None)
+    return key if member is None else (*key, str(member))
+
+def point_cache_filepath(key):
+    # Content addressed: one small NetCDF file per (model, product, run time, fxx, field) holding the
+    # values at every grid point we've ever extracted from that GRIB subset.
+    digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+    return os.path.join(POINT_CACHE_DIRECTORY, digest[:2], f"{digest}.nc")
+
+def grids_filepath():
+    return os.path.join(POINT_CACHE_DIRECTORY, "grids.json")
+
+def cached_grid_key(model, product):
+    # We need the grid definition to map stations to grid points before we can hit the point cache,
+    # and we don't want to download a GRIB file just for that.
+    filepath = grids_filepath()
+    if not os.path.exists(filepath):
+        return None
+
+    with open(filepath) as f:
+        return json.load(f).get(f"{model}/{product}")
+
+def store_grid_key(model, product, key):
+    filepath = grids_filepath()
+    grids = {}
+
+    # Models are fetched concurrently and we don't want to lose another model's key.
+    with _grids_lock:
+        if os.path.exists(filepath):
+            with open(filepath) as f:
+                grids = json.load(f)
+
+        grids[f"{model}/{product}"] = key
+
+        # Parallel workers may share the cache so we never leave a partially written file in place.
+        os.makedirs(POINT_CACHE_DIRECTORY, exist_ok=True)
+        with atomic_write(filepath) as f:
+            json.dump(grids, f, indent=2)
+
+def load_point_values(product, field, indices):
+    # Returns a dict of values at `indices` for each GRIB variable, or None unless all of them are cached.
+    filepath = point_cache_filepath(product_key(product, field))
+    if not os.path.exists(filepath):
+        return None
+
+    with xr.open_dataset(filepath, engine="scipy") as ds:
+        if not np.isin(indices, ds.point.values).all():
+            return None
+        values = {name: ds[name].sel(point=indices).values for name in ds.data_vars}
+
+    os.utime(filepath)  # Mark as recently used for LRU eviction.
+    return values
+
+def store_point_values(product, field, indices, values):
+    filepath = point_cache_filepath(product_key(product, field))
+
+    ds = xr.Dataset({name: ("point", np.asarray(v, dtype=np.float64)) for name, v in values.items()}, coords={"point": np.asarray(indices, dtype=np.int64)})
+
+    if os.path.exists(filepath):
+        with xr.open_dataset(filepath, engine="scipy") as cached:
+            cached = cached.load()
+        ds = xr.concat([cached.drop_sel(point=np.intersect1d(cached.point, ds.point)), ds], dim="point")
+
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with atomic_write(filepath, "wb") as f:
+        ds.sortby("point").to_netcdf(f, engine="scipy")
+
+def evict_point_cache(max_bytes=POINT_CACHE_MAX_BYTES):
+    # Least recently used entries go first until the cache fits in max_bytes.
+    entries = []
+    for root, _, filenames in os.walk(POINT_CACHE_DIRECTORY):
+        for filename in filenames:
+            if filename.endswith(".nc"):
+                stat = os.stat(os.path.join(root, filename))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, filename)))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+
+    for _, size, filepath in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass  # Another worker got to it first.
+        total -= size
+        evicted += 1
+
+    if evicted:
+        logging.info(f"Evicted {evicted} point cache entries ({total / 2**20:.1f} MiB left).")
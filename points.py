@@ -0,0 +1,239 @@
+import logging
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from eccodes import codes_grib_multi_support_on, codes_grib_new_from_file, codes_get, codes_get_array, codes_get_elements, codes_release
+from downloads import iter_herbie_downloads
+from grid_index import build_grid_index, load_grid_index, nearest_grid_points, interpolation_weights, neighbourhood_grid_points, neighbourhood_statistics, evict_interpolation_weights, STRUCTURED_METHODS
+from point_cache import cached_grid_key, store_grid_key, load_point_values, store_point_values, evict_point_cache
+
+logger = logging.getLogger(__name__)
+
+# NAM packs the 10 m u and v winds into a single multi-field message.
+codes_grib_multi_support_on()
+
+# ecCodes short names -> the variable names cfgrib (and hence Herbie's xarray datasets) use.
+GRIB_VARIABLES = {
+    "2t": "t2m",
+    "10u": "u10",
+    "10v": "v10",
+    "tp": "tp"
+}
+
+# Accumulations come with their window length in hours as e.g. tp_hours. Depths in meters (ECMWF) are
+# converted to kg/m^2, i.e. millimeters, like NCEP's.
+ACCUMULATION_UNIT_SCALES = {
+    "m": 1000,
+    "kg m**-2": 1
+}
+
+# How values at grid points become values at stations, one of grid_index.INTERPOLATION_METHODS.
+POINT_INTERPOLATION = "nearest"
+
+def grib_messages(filepath):
+    # Yields one decoded-on-demand GRIB message handle at a time so only one message is ever in memory.
+    with open(filepath, "rb") as f:
+        while (gid := codes_grib_new_from_file(f)) is not None:
+            try:
+                yield gid
+            finally:
+                codes_release(gid)
+
+def grib_grid_index(filepath):
+    # The md5 of the GRIB grid definition section identifies the grid so we only decode the
+    # latitudes and longitudes the first time we ever see a grid. The grid keeps its 2D shape
+    # (in scanning order) for bilinear and neighbourhood interpolation.
+    for gid in grib_messages(filepath):
+        shape = (codes_get(gid, "Nj"), codes_get(gid, "Ni"))
+        if codes_get(gid, "jPointsAreConsecutive"):
+            shape = shape[::-1]
+
+        key = f"{shape[0]}x{shape[1]}_{codes_get(gid, 'md5GridSection')}"
+        index = load_grid_index(key)
+
+        if index is None:
+            lats = codes_get_array(gid, "latitudes").reshape(shape)
+            lons = codes_get_array(gid, "longitudes").reshape(shape)
+            index = build_grid_index(lats, lons, key=key)
+
+        return index
+
+def closest_grid_indices(index, stations, verbose=True):
+    # stations is a list of (station, lat, lon) tuples. All of them are looked up in one vectorized query.
+    target_lats = [lat for _, lat, _ in stations]
+    target_lons = [lon for _, _, lon in stations]
+    n, distances = nearest_grid_points(index, target_lats, target_lons)
+
+    if verbose:
+        for (station, target_lat, target_lon), m, distance in zip(stations, n, distances):
+            closest_lat = index["latitudes"][m]
+            closest_lon = index["longitudes"][m]
+            logging.info(f"{station} target coordinates: {target_lat:.6f}°N, {target_lon:.6f}°E")
+            logging.info(f"{station} closest coordinates: {closest_lat:.6f}°N, {closest_lon:.6f}°E @ (n={m}) (Δ={distance/1000:.3f} km)")
+
+    return n.tolist()
+
+def station_extraction(index, stations, method=POINT_INTERPOLATION, verbose=True):
+    # The grid points the stations need and the sparse (station x point) weights that turn values at those
+    # points into station values. For neighbourhoods we also keep each station's points for min/max.
+    if verbose:
+        closest_grid_indices(index, stations, verbose=True)
+
+    lats = [lat for _, lat, _ in stations]
+    lons = [lon for _, _, lon in stations]
+
+    W = interpolation_weights(index, lats, lons, method=method)
+    points = np.unique(W.indices)
+    extraction = {"points": points.tolist(), "weights": W[:, points]}
+
+    if method == "neighbourhood":
+        neighbours = neighbourhood_grid_points(index, lats, lons)
+        extraction["neighbours"] = np.where(neighbours >= 0, np.searchsorted(points, neighbours), -1)
+
+    return extraction
+
+def station_values(extraction, values):
+    # values map GRIB variables to their values at extraction["points"]. All variables go through one
+    # sparse matrix product. Neighbourhoods also get e.g. t2m_min and t2m_max.
+    names = list(values)
+    stations = extraction["weights"] @ np.column_stack([values[name] for name in names])
+    extracted = {name: stations[:, k] for k, name in enumerate(names)}
+
+    if "neighbours" in extraction:
+        for name in names:
+            if f"{name}_hours" in values or name.endswith("_hours"):
+                continue  # Neighbourhood extremes of accumulations aren't amounts that fell anywhere.
+            statistics = neighbourhood_statistics(values[name], extraction["neighbours"])
+            extracted[f"{name}_min"] = statistics["min"]
+            extracted[f"{name}_max"] = statistics["max"]
+
+    return extracted
+
+def grib_point_values(filepath, indices):
+    # Only the values at `indices` (flat indices in scanning order) survive each message. Files can hold
+    # several accumulation windows for the same variable (e.g. HRRR's run total and last hour) and we keep
+    # the longest since it's the one least likely to depend on other forecast hours.
+    values = {}
+
+    for gid in grib_messages(filepath):
+        name = GRIB_VARIABLES.get(codes_get(gid, "shortName"), codes_get(gid, "shortName"))
+        accumulation = codes_get(gid, "stepType") == "accum"
+
+        if accumulation:
+            window_hours = codes_get(gid, "endStep") - codes_get(gid, "startStep")
+            if name in values and values[f"{name}_hours"][0] >= window_hours:
+                continue
+        elif name in values:
+            continue
+
+        point_values = np.asarray(codes_get_elements(gid, "values", indices))
+        if codes_get(gid, "bitmapPresent"):
+            point_values[point_values == codes_get(gid, "missingValue")] = np.nan
+
+        if accumulation:
+            point_values *= ACCUMULATION_UNIT_SCALES.get(codes_get(gid, "units"), 1)
+            values[f"{name}_hours"] = np.full(len(point_values), window_hours, dtype=np.float64)
+
+        values[name] = point_values
+
+    return values
+
+def cached_station_extraction(products, stations, method=POINT_INTERPOLATION):
+    key = cached_grid_key(products[0].model, products[0].product)
+    index = load_grid_index(key) if key else None
+
+    # Grid indices from before we kept the grid's shape are flat.
+    if index is None or (method in STRUCTURED_METHODS and len(index["shape"]) != 2):
+        return None
+
+    return station_extraction(index, stations, method=method, verbose=True)
+
+def forecast_valid_time(product):
+    return pd.Timestamp(product.date) + pd.Timedelta(hours=product.fxx)
+
+def iter_forecast_stations_values(products, fields, stations, use_cache=True, method=POINT_INTERPOLATION):
+    # Yields (valid time, values) for each forecast hour as soon as all of its GRIB subsets are in the point
+    # cache or downloaded, where values maps variable names to the values at every station. Hours come out
+    # in the order they arrive, not in time order, so consumers can start on the first hours while the rest
+    # of the run is still downloading. Only one GRIB message is ever decoded at a time.
+    #
+    # The grid points and interpolation weights are resolved once from the first file and reused for every
+    # other hour since a model run shares one grid. The point cache holds raw grid point values so values
+    # already in it are not downloaded or decoded again unless use_cache=False, whatever the method.
+    extraction = cached_station_extraction(products, stations, method=method) if use_cache else None
+    cached = {}
+    pending = []
+
+    for n, product in enumerate(products):
+        cached[n] = {}
+        if extraction is not None:
+            for field in fields:
+                field_values = load_point_values(product, field, extraction["points"])
+                if field_values is not None:
+                    cached[n][field] = field_values
+
+        if len(cached[n]) == len(fields):
+            values = {}
+            for field in fields:
+                values.update(cached[n][field])
+            yield forecast_valid_time(product), station_values(extraction, values)
+        else:
+            pending.append(n)
+
+    if extraction is not None:
+        logging.info(f"Found {sum(map(len, cached.values()))}/{len(products) * len(fields)} GRIB subsets in the point cache.")
+
+    failures = []
+    downloads = iter_herbie_downloads([products[n] for n in pending], fields) if pending else []
+
+    for k, failed in downloads:
+        n = pending[k]
+        product = products[n]
+
+        if failed:
+            failures += failed
+            continue
+
+        values = {}
+        for field in fields:
+            field_values = cached[n].get(field)
+
+            if field_values is None:
+                filepath = product.get_localFilePath(field)
+
+                if extraction is None:
+                    index = grib_grid_index(filepath)
+                    store_grid_key(product.model, product.product, index["key"])
+                    extraction = station_extraction(index, stations, method=method, verbose=True)
+
+                field_values = grib_point_values(filepath, extraction["points"])
+
+                if use_cache:
+                    store_point_values(product, field, extraction["points"], field_values)
+
+            values.update(field_values)
+
+        yield forecast_valid_time(product), station_values(extraction, values)
+
+    if use_cache:
+        evict_point_cache()
+    evict_interpolation_weights()
+
+    if failures:
+        raise RuntimeError(f"Failed to download {len(failures)} GRIB subsets: {', '.join(failures)}")
+
+def forecast_stations_values(products, fields, stations, use_cache=True, method=POINT_INTERPOLATION):
+    hours = dict(iter_forecast_stations_values(products, fields, stations, use_cache=use_cache, method=method))
+    times = sorted(hours)
+    rows = [hours[t] for t in times]
+
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    missing = np.full(len(stations), np.nan)
+
+    ds = xr.Dataset(
+        {name: (("time", "station"), np.stack([row.get(name, missing) for row in rows])) for name in names},
+        coords={"time": pd.DatetimeIndex(times), "station": [station for station, _, _ in stations]}
+    )
+
+    return ds
@@ -0,0 +1,83 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MILLIMETERS_PER_INCH = 25.4
+
+# Routine METARs go out at :53 and report precipitation since the previous routine METAR, while specials
+# report it since the last routine one. Shifting by 7 minutes puts every report in the hour it mostly covers.
+METAR_PRECIPITATION_OFFSET = pd.Timedelta(minutes=7)
+
+def mm2inches(mm):
+    return mm / MILLIMETERS_PER_INCH
+
+def accumulation_totals(amounts, window_hours, steps):
+    # Models accumulate precipitation over different windows: HRRR since the start of the run, NAM in
+    # 3-hour buckets, ECMWF since the start of the run but only every 3 hours. amounts[k] fell over the
+    # window_hours[k] hours up to steps[k] (hours since the run started, increasing). Returns the total
+    # since the start of the run at every step, elementwise over any trailing (e.g. station) dimensions,
+    # NaN where a window doesn't start at the run start or an earlier step.
+    steps = np.asarray(steps, dtype=np.float64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    window_hours = np.broadcast_to(np.asarray(window_hours, dtype=np.float64), amounts.shape)
+
+    known_steps = np.concatenate([[0.0], steps])
+    totals = np.full((len(known_steps), *amounts.shape[1:]), np.nan)
+    totals[0] = 0
+
+    for k, step in enumerate(steps):
+        starts = step - window_hours[k]
+        j = np.clip(np.searchsorted(known_steps, np.nan_to_num(starts, nan=-1)), 0, k)
+        previous = np.take_along_axis(totals, j[np.newaxis], axis=0)[0] if np.ndim(j) else totals[j]
+        totals[k+1] = np.where(known_steps[j] == starts, previous + amounts[k], np.nan)
+
+    # Nothing has fallen at the start of the run, whether or not the analysis has a precipitation field.
+    totals[1:][steps == 0] = 0
+    return totals[1:]
+
+def deaccumulate(amounts, window_hours, steps):
+    # Precipitation between each step and the one before it. The first step gets what fell since the run
+    # started, which is nothing for the analysis.
+    totals = accumulation_totals(amounts, window_hours, steps)
+    return np.diff(totals, axis=0, prepend=np.zeros((1, *totals.shape[1:])))
+
+def deaccumulate_dataset(ds, forecast_time, variable="precipitation"):
+    # ds is a (time, station) model dataset with the raw accumulations and their window lengths in
+    # `{variable}_hours`. Returns it with the precipitation since the previous output time instead, so
+    # summing over any window made of whole output intervals (e.g. 6Z-6Z) gives that window's total.
+    if f"{variable}_hours" not in ds:
+        return ds
+
+    steps = (ds.time.values - np.datetime64(pd.Timestamp(forecast_time))) / np.timedelta64(1, "h")
+    amounts = deaccumulate(ds[variable].transpose("time", ...).values, ds[f"{variable}_hours"].transpose("time", ...).values, steps)
+
+    return ds.drop_vars(f"{variable}_hours").assign({variable: (ds[variable].transpose("time", ...).dims, amounts)})
+
+def reaccumulate(amounts, times):
+    # amounts are a DataArray of precipitation since the previous time. Returns the precipitation since the
+    # previous of `times` instead, spreading every amount evenly over its interval, e.g. to put 3-hourly
+    # ECMWF amounts on an hourly axis. Nothing is known before the first time of either axis.
+    totals = amounts.sortby("time").cumsum("time", skipna=False)
+    totals = totals.interp(time=times)
+    return totals.diff("time", label="upper").reindex(time=times)
+
+def metar_hourly_precipitation(precipitation):
+    # precipitation is a series of METAR p01i reports. Returns the precipitation in each hour ending at
+    # the index time, as the largest report that mostly covers it.
+    hours = (precipitation.index + METAR_PRECIPITATION_OFFSET).ceil("h")
+    return precipitation.groupby(hours).max().rename_axis(precipitation.index.name)
+
+def metar_hourly_precipitation_dataarray(precipitation):
+    # Same as metar_hourly_precipitation for a DataArray with a time dimension.
+    shifted = precipitation.assign_coords(time=precipitation.time.values + METAR_PRECIPITATION_OFFSET)
+    return shifted.resample(time="1h", closed="right", label="right").max()
+
+def window_precipitation_frame(timeseries, variable="precipitation"):
+    # Replaces the METAR reports in a station's observations with hourly totals for window statistics.
+    if variable not in timeseries:
+        return timeseries
+
+    hourly = metar_hourly_precipitation(timeseries[variable].dropna())
+    return pd.concat([timeseries.drop(columns=variable), hourly.to_frame(variable)])
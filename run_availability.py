@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import logging
+import threading
+import requests
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+from http_client import head, HTTP_CONCURRENCY
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+RUN_AVAILABILITY_FILEPATH = "run_availability.json"
+AVAILABLE_TTL = 6 * 3600  # seconds, a published index doesn't go away for days.
+MISSING_TTL = 120  # seconds, a missing index might show up any minute.
+PROBE_TIMEOUT = 10  # seconds
+PROBE_WORKERS = HTTP_CONCURRENCY  # As many as the shared session keeps connections for.
+
+_availability_lock = threading.Lock()
+
+def load_availability():
+    if not os.path.exists(RUN_AVAILABILITY_FILEPATH):
+        return {}
+
+    with open(RUN_AVAILABILITY_FILEPATH) as f:
+        return json.load(f)
+
+def store_availability(probed):
+    # Models are probed from concurrent threads and processes, so what we probed is merged into whatever is on
+    # disk right before writing instead of overwriting it with what we loaded earlier. The newest check of a
+    # URL wins. Expired entries are dropped so the file doesn't grow forever.
+    with _availability_lock:
+        availability = load_availability()
+        for url, (checked, available) in probed.items():
+            if url not in availability or availability[url][0] < checked:
+                availability[url] = (checked, available)
+
+        now = time.time()
+        availability = {url: (checked, available) for url, (checked, available) in availability.items()
+                        if now - checked < (AVAILABLE_TTL if available else MISSING_TTL)}
+
+        with atomic_write(RUN_AVAILABILITY_FILEPATH) as f:
+            json.dump(availability, f)
+
+def cached_availability(availability, url):
+    if url not in availability:
+        return None
+
+    checked, available = availability[url]
+    ttl = AVAILABLE_TTL if available else MISSING_TTL
+    return available if time.time() - checked < ttl else None
+
+def index_available(url):
+    # A HEAD request for the (tiny) index file tells us whether the run has been published up to that hour
+    # without touching the GRIB file itself. Probes go through the shared HTTP client and its retries, and
+    # a missing index is a 404 (or a 403 from buckets that don't allow listing).
+    try:
+        response = head(url, timeout=PROBE_TIMEOUT, allow_redirects=True)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code not in (403, 404):
+            logging.warning(f"Failed to probe {url}: {e!r}")
+        return False
+    except requests.RequestException as e:
+        logging.warning(f"Failed to probe {url}: {e!r}")
+        return False
+    return response.status_code == 200
+
+def candidate_runs(cadence_hours, n, now=None):
+    # The n most recent cycles, newest first.
+    now = pd.Timestamp.now("UTC").tz_localize(None) if now is None else pd.Timestamp(now)
+    latest = now.floor(f"{cadence_hours}h")
+    return [latest - pd.Timedelta(hours=cadence_hours * k) for k in range(n)]
+
+def runs_availability(index_url, runs, fxx, max_workers=PROBE_WORKERS):
+    # Checks whether the index for forecast hour fxx exists for every run at once. Results are cached on disk
+    # so repeated lookups (other models, other processes, the next cron run) don't hit the network again.
+    availability = load_availability()
+    urls = {run: index_url.format(date=run, fxx=fxx) for run in runs}
+    results = {run: cached_availability(availability, url) for run, url in urls.items()}
+
+    unknown = [run for run, available in results.items() if available is None]
+    if unknown:
+        start = time.perf_counter()
+        probed = {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(unknown))) as pool:
+            for run, available in zip(unknown, pool.map(index_available, [urls[run] for run in unknown])):
+                results[run] = available
+                probed[urls[run]] = (time.time(), available)
+        logging.info(f"Probed {len(unknown)} runs in {time.perf_counter() - start:.2f} s.")
+        store_availability(probed)
+
+    return results
+
+def latest_complete_run(index_url, cadence_hours, forecast_hours, n=6, now=None):
+    # A run is complete once the index for its last forecast hour we need has been published.
+    runs = candidate_runs(cadence_hours, n, now=now)
+    availability = runs_availability(index_url, runs, forecast_hours)
+
+    for run in runs:
+        if availability[run]:
+            logging.info(f"Latest complete forecast out to {forecast_hours} hours: {run} ({runs.index(run)} cycles back)")
+            return run
+
+    raise RuntimeError(f"No complete run in the last {n} cycles ({runs[-1]} to {runs[0]}): {index_url}")
+
+if __name__ == "__main__":
+    from models import MODELS
+    from utils import configure_logging
+    configure_logging()
+
+    for model, config in MODELS.items():
+        run = latest_complete_run(config["index_url"], config["cadence_hours"], config["forecast_hours"], n=config["latest_runs"])
+        print(f"{model}: {run}")
@@ -1,4 +1,4 @@
-import logging.config
+import logging
 import smtplib, ssl
 from os.path import basename
 from email.mime.application import MIMEApplication
@@ -6,7 +6,6 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import COMMASPACE, formatdate
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 HEADERS = {
@@ -1,11 +1,10 @@
-import logging.config
+import logging
 from datetime import datetime
 
 import ffmpeg
 
 from utils import download_images
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 HRRR_SOUNDING_HOURS = 12
@@ -1,42 +1,47 @@
-import logging.config
+import os
+import logging
+import tempfile
 import numpy as np
 import pandas as pd
 
+from contextlib import contextmanager
 from datetime import datetime
-from subprocess import run
-from numpy import deg2rad, sin, cos, sqrt, arctan2, abs, maximum, min, where, array, datetime64
-from xarray import Dataset
-from herbie import Herbie
-from herbie.tools import Herbie_latest
+from numpy import deg2rad, sin, cos, sqrt, arctan2, abs
 
-logging.config.fileConfig("logging.ini", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 METERS_PER_SECOND_TO_KNOTS = 1.943844  # See https://en.wikipedia.org/wiki/Knot_(unit)#Definitions
 
-# Herbie
+# Logging
 
-def latest_complete_forecast_time(n, freq_hours, model, product, forecast_hours, verbose=True):
-    freq = f"{freq_hours}h"
-    latest_product = Herbie_latest(n=n, freq=freq, model=model, product=product)
+def configure_logging(filepath="logging.ini"):
+    # Entry points (the __main__ blocks) configure logging once, modules just ask for a logger.
+    import logging.config
+    logging.config.fileConfig(filepath, disable_existing_loggers=False)
 
-    if verbose:
-        logging.info(f"Latest forecast (model={model}, product={product}, freq={freq}): {latest_product.date}")
-
-    max_forecast = Herbie(latest_product.date, model=model, product=product, fxx=forecast_hours)
+# Files
 
-    if any([max_forecast.grib is not None, max_forecast.idx is not None]):
-        forecast_time = latest_product.date
-        logging.info("Latest forecast complete.")
-    else:
-        forecast_time = latest_product.date - pd.Timedelta(freq_hours, "h")
-        logging.info(f"Latest forecast not complete. Using forecast from {forecast_time}")
+@contextmanager
+def atomic_write(filepath, mode="w"):
+    # Yields a temporary file next to filepath that replaces it once fully written, so nothing (other threads,
+    # other processes, the next cron run) ever reads a partially written file. Every writer gets a temporary
+    # file of its own and it's removed again if writing fails.
+    directory, name = os.path.split(filepath)
+    f = tempfile.NamedTemporaryFile(mode, dir=directory or ".", prefix=f"{name}.", suffix=".tmp", delete=False)
 
-    return forecast_time
+    try:
+        with f:
+            yield f
+        os.replace(f.name, filepath)
+    except BaseException:
+        if os.path.exists(f.name):
+            os.remove(f.name)
+        raise
 
 # Time wrangling
 
-def compute_6Z_times(forecast_time=datetime.utcnow()):
+def compute_6Z_times(forecast_time=None):
+    forecast_time = datetime.utcnow() if forecast_time is None else forecast_time
     utc_today = pd.Timestamp(datetime(forecast_time.year, forecast_time.month, forecast_time.day))
     first_6Z = utc_today + pd.Timedelta(days=1, hours=6)
     second_6Z = utc_today + pd.Timedelta(days=2, hours=6)
@@ -70,20 +75,21 @@ def haversine_distance(lat1, lon1, lat2, lon2, R=6371.228e3):
 # Data wrangling
 
 def closest_xy_coordinates(ds, target_lat, target_lon, verbose=True):
-    lats = ds.latitude
-    lons = ds.longitude
+    # Curvilinear (e.g. Lambert conformal) grids need a proper great-circle nearest neighbour search.
+    # The grid index is built once per grid and cached on disk so repeated lookups are O(log n).
+    from grid_index import build_grid_index, nearest_grid_points
 
-    abs_lat = abs(lats - target_lat)
-    abs_lon = abs(lons - target_lon)
-    abs_distance = maximum(abs_lon, abs_lat)
+    lats = ds.latitude.data
+    lons = ds.longitude.data
 
-    x, y = where(abs_distance == min(abs_distance))
-    x, y = x[0], y[0]
+    index = build_grid_index(lats, lons)
+    n, distance = nearest_grid_points(index, target_lat, target_lon)
+    x, y = np.unravel_index(n[0], index["shape"])
 
     if verbose:
-        closest_lat = lats.data[x, y]
-        closest_lon = lons.data[x, y]
-        distance = haversine_distance(target_lat, target_lon, closest_lat, closest_lon)
+        closest_lat = lats[x, y]
+        closest_lon = lons[x, y]
+        distance = distance[0]
 
         logging.info(f"Target coordinates: {target_lat:.6f}°N, {target_lon:.6f}°E")
         logging.info(f"Closest coordinates: {closest_lat:.6f}°N, {closest_lon:.6f}°E @ (x={x}, y={y}) (Δ={distance/1000:.3f} km)")
@@ -106,27 +112,5 @@ def closest_latlon_coordinates(ds, target_lat, target_lon, verbose=True):
 
     return x, y
 
-# Time series wrangling
-
-def timeseries_max(ts):
-    t = ts.index
-    S = ts.values
-
-    i_max = np.argmax(S)
-    t_max = t[i_max]
-    S_max = S[i_max]
-
-    return t_max, S_max
-
-def timeseries_min_and_max(ts):
-    t = ts.index
-    S = ts.values
-
-    i_min = np.argmin(S)
-    i_max = np.argmax(S)
-    t_min = t[i_min]
-    t_max = t[i_max]
-    S_min = S[i_min]
-    S_max = S[i_max]
-
-    return t_min, S_min, t_max, S_max
+def station_time_series(ds, station):
+    return ds.sel(station=station).drop_vars("station").to_dataframe()
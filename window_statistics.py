@@ -0,0 +1,71 @@
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# WxChallenge forecast days run from 6Z to 6Z.
+WINDOW_HOUR = 6
+
+# Statistics computed for every window. min/max come with the time they occur at.
+WINDOW_STATISTICS = {
+    "temperature": ["min", "max"],
+    "wind_speed": ["max"],
+    "precipitation": ["sum"]
+}
+
+def time_series_frame(timeseries):
+    # timeseries maps (source, station) to a DataFrame indexed by time. Returns one long frame.
+    return pd.concat(timeseries, names=["source", "station", "time"]).reset_index()
+
+def datasets_frame(datasets):
+    # datasets maps source to a (time, station) dataset. Returns one long frame.
+    frames = {source: ds.to_dataframe(dim_order=["time", "station"]) for source, ds in datasets.items()}
+    return pd.concat(frames, names=["source"]).reset_index()
+
+def window_starts(times, hour=WINDOW_HOUR):
+    times = pd.DatetimeIndex(times)
+    return (times - pd.Timedelta(hours=hour)).floor("D") + pd.Timedelta(hours=hour)
+
+def with_windows(df, hour=WINDOW_HOUR):
+    # Windows include both ends (like slicing ts[first_6Z:second_6Z]) so values right at 6Z are also
+    # added to the window that ends there. `opens` marks values at the very start of their window.
+    starts = window_starts(df["time"], hour=hour)
+    df = df.assign(window=starts, opens=(pd.DatetimeIndex(df["time"]) == starts))
+    closing = df[df["opens"]].assign(window=lambda d: d["window"] - pd.Timedelta(days=1), opens=False)
+    return pd.concat([df, closing], ignore_index=True)
+
+def window_statistics(df, statistics=WINDOW_STATISTICS, keys=("source", "station"), hour=WINDOW_HOUR):
+    # df is a long frame with the `keys` and "time" columns plus one column per variable. Returns one row
+    # per (*keys, window), where window is the 6Z a window starts at, with e.g. temperature_min,
+    # temperature_min_time, temperature_max, temperature_max_time, wind_speed_max, wind_speed_max_time
+    # and precipitation_sum columns. Every statistic is one groupby pass over all keys and windows.
+    groups = [*keys, "window"]
+    df = with_windows(df, hour=hour)
+    columns = {}
+
+    for variable, stats in statistics.items():
+        if variable not in df:
+            continue
+
+        values = df[[*groups, "time", "opens", variable]].dropna(subset=[variable])
+        by_window = values.groupby(groups, sort=False)[variable]
+
+        for stat in stats:
+            if stat in ("min", "max"):
+                # Ties go to the earliest time, like np.argmin/np.argmax.
+                extremes = by_window.idxmin() if stat == "min" else by_window.idxmax()
+                rows = values.loc[extremes.values]
+                columns[f"{variable}_{stat}"] = pd.Series(rows[variable].values, index=extremes.index)
+                columns[f"{variable}_{stat}_time"] = pd.Series(rows["time"].values, index=extremes.index)
+            elif stat == "sum":
+                # Accumulations valid at 6Z cover the hour before so they only count towards the window that ends there.
+                columns[f"{variable}_sum"] = values[~values["opens"]].groupby(groups, sort=False)[variable].sum()
+            else:
+                raise ValueError(f"Unknown window statistic: {stat}")
+
+    return pd.DataFrame(columns).sort_index()
+
+def window_rows(stats, station, window):
+    # The statistics of every source for one station and window, indexed by source.
+    selected = (stats.index.get_level_values("station") == station) & (stats.index.get_level_values("window") == window)
+    return stats[selected].droplevel(["station", "window"])